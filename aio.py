@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+import asyncio
+import logging
+import time
+
+import metrics
+import model
+
+# Set logger
+log = logging.getLogger()
+
+MAX_CONCURRENT = 64
+
+# asyncio front end for the model queries. Statements go out with
+# session.execute_async and every page the driver delivers on its own threads is
+# handed to the event loop, so many lookups can be in flight from one coroutine.
+
+class _Pages:
+    # Receives the pages of one ResponseFuture; the driver keeps calling the same
+    # callbacks for every page fetched with start_fetching_next_page()
+    def __init__(self, response_future, loop):
+        self.response_future = response_future
+        self.loop = loop
+        self.queue = asyncio.Queue()
+        response_future.add_callbacks(self._on_page, self._on_error)
+
+    def _on_page(self, rows):
+        self.loop.call_soon_threadsafe(self.queue.put_nowait, (rows, None))
+
+    def _on_error(self, exc):
+        self.loop.call_soon_threadsafe(self.queue.put_nowait, (None, exc))
+
+    async def rows(self):
+        result = []
+        while True:
+            rows, error = await self.queue.get()
+            if error is not None:
+                raise error
+            result.extend(rows)
+            if not self.response_future.has_more_pages:
+                return result
+            self.response_future.start_fetching_next_page()
+
+async def execute(session, name, params, page_size=model.PAGE_SIZE):
+    bound = model.get_statements(session).bind(name, params, page_size)
+    pages = _Pages(session.execute_async(bound), asyncio.get_running_loop())
+    return await pages.rows()
+
+async def query_rows(session, name, params, page_size=model.PAGE_SIZE, start_date=None, end_date=None):
+    # Like model.query_rows: in the bucketed layout, one query per bucket, merged newest first
+    if not model.get_statements(session).bucketed or name not in model.STATEMENT_TABLES:
+        return await execute(session, name, params, page_size)
+    if start_date is not None and end_date is not None:
+        buckets = model.month_buckets(start_date, end_date)
+    else:
+        index_name = model.BUCKETED_TABLES[model.STATEMENT_TABLES[name]][2]
+        listed = [row[0] for row in await execute(session, 'partition_buckets', [index_name, params[0]])]
+        buckets = model.select_buckets(listed, start_date, end_date)
+    pages = await gather_bounded(
+        [execute(session, name + model.BUCKET_SUFFIX, model.bucket_params(name, params, bucket), page_size)
+         for bucket in buckets],
+        model.MAX_BUCKET_FANOUT)
+    return [row for rows in pages for row in rows]
+
+async def _query(session, name, params, record, page_size=model.PAGE_SIZE, start_date=None, end_date=None):
+    label = metrics.statement_label(name)
+    query_cache = model.get_statements(session).cache
+    if query_cache is not None:
+        # On a miss the cache hands back its generation, for put
+        found, cached = query_cache.get(name, params)
+        if found:
+            metrics.REGISTRY.cache_hit(label)
+            return list(cached)
+        metrics.REGISTRY.cache_miss(label)
+        generation = cached
+    started = time.perf_counter()
+    try:
+        rows = await query_rows(session, name, params, page_size, start_date, end_date)
+        records = [record._make(row) for row in rows]
+    except Exception as exc:
+        metrics.REGISTRY.error(label, exc)
+        raise
+    metrics.REGISTRY.observe(label, time.perf_counter() - started, len(records))
+    if query_cache is not None:
+        query_cache.put(name, params, records, generation)
+    return list(records)
+
+# Q1
+async def get_orders_by_customer(session, email, page_size=model.PAGE_SIZE, start_date=None, end_date=None):
+    name = 'orders_by_customer' + model.DATE_RANGES[(start_date is not None, end_date is not None)]
+    params = [email] + model.date_bounds(start_date, end_date)
+    return await _query(session, name, params, model.Order, page_size, start_date, end_date)
+
+# Q2
+async def get_products_by_order(session, order_number, page_size=model.PAGE_SIZE):
+    return await _query(session, 'products_by_order', [order_number], model.Product, page_size)
+
+# Q3.1 - Q3.5
+async def find_shipments(session, order_number, ship_status=None, ship_type=None, start_date=None, end_date=None,
+                         table=None, page_size=model.PAGE_SIZE):
+    plan = model.plan_shipments(order_number, ship_status, ship_type, start_date, end_date, table)
+    shipments = await _query(session, plan.statement, plan.params, model.Shipment, page_size,
+                             plan.start_date, plan.end_date)
+    return model.apply_residual(plan, shipments)
+
+async def gather_bounded(coroutines, limit=MAX_CONCURRENT):
+    semaphore = asyncio.Semaphore(limit)
+
+    async def run(coroutine):
+        async with semaphore:
+            return await coroutine
+
+    return await asyncio.gather(*(run(coroutine) for coroutine in coroutines))
+
+# Order detail fan-out: Q1 for the customer, then Q2 and Q3.1 for every order at
+# once, so the whole page costs about two round-trips of wall time instead of 2N+1.
+# At most limit orders are fetched at a time (two requests each).
+# Returns [(order, products, shipments), ...] in Q1 order.
+async def get_customer_order_details(session, email, limit=MAX_CONCURRENT):
+    orders = await get_orders_by_customer(session, email)
+
+    # A coroutine, not a gather: gather schedules its tasks right away, before
+    # gather_bounded has taken the semaphore
+    async def detail(order):
+        return await asyncio.gather(get_products_by_order(session, order.order_number),
+                                    find_shipments(session, order.order_number))
+
+    details = await gather_bounded([detail(order) for order in orders], limit)
+    return [(order, products, shipments) for order, (products, shipments) in zip(orders, details)]
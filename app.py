@@ -1,12 +1,18 @@
 #!/usr/bin/env python3
+import argparse
+import json
 import logging
-import os
 import sys
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
 
-
-from cassandra.cluster import Cluster
-
+import config
+import export
+import metrics
 import model
+import render
 
 # Set logger
 log = logging.getLogger()
@@ -15,10 +21,8 @@ handler = logging.FileHandler('logistics.log')
 handler.setFormatter(logging.Formatter("%(asctime)s [%(levelname)s] %(name)s: %(message)s"))
 log.addHandler(handler)
 
-# Read env vars related to Cassandra App
-CLUSTER_IPS = os.getenv('CASSANDRA_CLUSTER_IPS', '127.0.0.1')
-KEYSPACE = os.getenv('CASSANDRA_KEYSPACE', 'logistics')
-REPLICATION_FACTOR = os.getenv('CASSANDRA_REPLICATION_FACTOR', '1')
+# Cassandra App settings from env vars / CASSANDRA_CONFIG file (see config.py)
+CONFIG = config.load_config()
 
 def print_menu():
     mm_options = {
@@ -59,17 +63,262 @@ def get_shipment_type():
     ship_type = input('Enter shipment type: ').strip()
     return ship_type
 
-def main():
+def get_date_range():
+    print("\nEnter date range (leave empty for all dates)")
+    start_input = input("Start date (YYYY-MM-DD): ").strip()
+    end_input = input("End date (YYYY-MM-DD): ").strip()
+    return model.parse_date_range(start_input, end_input)
+
+# Q3.x queries by name: the filters each one requires
+SHIPMENT_QUERIES = {
+    'q3.1': (),
+    'q3.2': ('start_date', 'end_date'),
+    'q3.3': ('status',),
+    'q3.4': ('ship_type',),
+    'q3.5': ('ship_type', 'status'),
+}
+QUERIES = ['q1', 'q1.summary', 'q2'] + list(SHIPMENT_QUERIES)
+# The 'query' flag (and workload key, without the dashes) that sets each filter
+FILTER_FLAGS = {'order': '--order', 'status': '--status', 'ship_type': '--type', 'start_date': '--from',
+                'end_date': '--to'}
+
+# Runs a query by name without prompting; returns the JSON-ready result. With paged
+# (or a paging_state from a previous result) it returns one page of page_size rows
+# and the paging_state, hex encoded, that fetches the next one (None on the last).
+def run_query(session, query, email=None, order=None, status=None, ship_type=None,
+              start_date=None, end_date=None, page_size=model.PAGE_SIZE, paging_state=None, paged=False):
+    result = {'query': query}
+    paged = paged or paging_state is not None
+    if isinstance(paging_state, str):
+        paging_state = bytes.fromhex(paging_state)
+    page = None
+    if query == 'q1':
+        if not email:
+            raise ValueError("q1 requires --email")
+        if paged:
+            page = model.get_orders_by_customer_page(session, email, page_size, paging_state, start_date, end_date)
+        else:
+            records = model.get_orders_by_customer(session, email, page_size, start_date, end_date)
+    elif query == 'q1.summary':
+        if not email:
+            raise ValueError("q1.summary requires --email")
+        if paged:
+            page = model.get_order_summaries_page(session, email, page_size, paging_state)
+        else:
+            records = model.get_order_summaries(session, email, page_size)
+    elif query == 'q2':
+        if not order:
+            raise ValueError("q2 requires --order")
+        if paged:
+            page = model.get_products_by_order_page(session, order, page_size, paging_state)
+        else:
+            records = model.get_products_by_order(session, order)
+    elif query in SHIPMENT_QUERIES:
+        filters = {'status': status, 'ship_type': ship_type, 'start_date': start_date, 'end_date': end_date}
+        missing = [name for name in ('order',) + SHIPMENT_QUERIES[query]
+                   if not (order if name == 'order' else filters[name])]
+        if missing:
+            raise ValueError(f"{query} requires {', '.join(FILTER_FLAGS[name] for name in missing)}")
+        plan = model.plan_shipments(order, status, ship_type, start_date, end_date)
+        if paged:
+            page = model.find_shipments_page(session, order, status, ship_type, start_date, end_date,
+                                             page_size=page_size, paging_state=paging_state)
+        else:
+            records = model.run_shipment_plan(session, plan, page_size)
+        result['table'] = plan.table
+    else:
+        raise ValueError(f"Unknown query {query}")
+    if page is not None:
+        records = page.rows
+        result['paging_state'] = page.paging_state.hex() if page.paging_state is not None else None
+    result['count'] = len(records)
+    result['rows'] = [record._asdict() for record in records]
+    return result
+
+def to_json(value):
+    return json.dumps(value, default=str, ensure_ascii=False)
+
+# Commands that may write and so bring the schema up to date first (None: the menu)
+MIGRATE_COMMANDS = {None, 'load'}
+
+def connect(migrate=True):
     log.info("Connecting to Cluster")
-    cluster = Cluster(CLUSTER_IPS.split(','))
-    session = cluster.connect()
+    cluster, session = config.connect(CONFIG, migrate)
+    if CONFIG['driver_metrics']:
+        metrics.REGISTRY.attach_cluster(cluster)
+    if CONFIG['metrics_port']:
+        metrics.start_http_server(CONFIG['metrics_port'])
+    if CONFIG['metrics_file']:
+        metrics.start_dump(CONFIG['metrics_file'], CONFIG['metrics_interval'])
+
+    if CONFIG['query_cache_size'] > 0:
+        model.enable_cache(session, CONFIG['query_cache_size'], CONFIG['query_cache_ttl'])
+    return cluster, session
+
+def migrate_command(args):
+    cluster = config.build_cluster(CONFIG)
+    try:
+        created = model.migrate(cluster.connect(), CONFIG['keyspace'], CONFIG['replication_factor'],
+                                CONFIG['bucketed'], CONFIG['money_cents'])
+    finally:
+        cluster.shutdown()
+    print(to_json({'keyspace': CONFIG['keyspace'], 'bucketed': CONFIG['bucketed'],
+                   'money_cents': CONFIG['money_cents'], 'created': created}))
+
+def load_command(session, args):
+    # Imported here, like bench in replay_command, to keep other commands' startup short
+    import parallel_load
+
+    summary = parallel_load.load(CONFIG, args.orders, args.processes, args.seed,
+                                 args.products_per_order, args.shipments_per_order, args.first_order)
+    print(to_json(summary))
+
+def query_command(session, args):
+    print(to_json(run_query(session, args.query, args.email, args.order, args.status, args.ship_type,
+                            args.start_date, args.end_date, args.page_size, args.paging_state, args.paged)))
+
+def export_command(session, args):
+    tables = args.tables.split(',') if args.tables else None
+    print(to_json(export.export(session, args.out_dir, tables, args.format, args.splits,
+                                args.parallelism, args.fetch_size)))
+
+def update_status_command(session, args):
+    shipment = model.get_shipment(session, args.order, args.shipment_date)
+    if shipment is None:
+        raise ValueError(f"No shipment {args.shipment_date} in order {args.order}")
+    order_key = None
+    if args.email:
+        order_key = (args.email, args.order_date) if args.order_date else model.find_order_key(session, args.email, args.order)
+    result = model.update_shipment_status(session, shipment, args.status, order_key=order_key)
+    print(to_json(dict(result._asdict(), shipment=result.shipment._asdict())))
 
-    model.create_keyspace(session, KEYSPACE, REPLICATION_FACTOR)
-    session.set_keyspace(KEYSPACE)
+def check_command(session, args):
+    print(to_json(model.check_order_summaries(session, args.email, args.repair)))
 
-    model.create_schema(session)
+def _replay_params(line):
+    entry = json.loads(line)
+    return {
+        'query': entry['query'],
+        'email': entry.get('email'),
+        'order': entry.get('order'),
+        'status': entry.get('status'),
+        'ship_type': entry.get('type'),
+        'start_date': model.parse_date(entry['from']) if entry.get('from') else None,
+        'end_date': model.parse_date(entry['to']) if entry.get('to') else None,
+    }
+
+# Replays a JSON-lines file of queries ({"query": "q3.3", "order": ..., "status": ...,
+# "type": ..., "from": "YYYY-MM-DD", "to": ...}) on an open-loop schedule of args.rate
+# queries per second (0 = as fast as possible) and prints latency stats per query.
+def replay_command(session, args):
+    import bench
+
+    stats = {}
+    lock = threading.Lock()
+
+    def execute(params, scheduled):
+        started = time.perf_counter()
+        try:
+            rows = run_query(session, **params)['count']
+            error = False
+        except Exception as exc:
+            log.warning(f"Replay query failed: {exc!r}")
+            rows, error = 0, True
+        finished = time.perf_counter()
+        with lock:
+            entry = stats.setdefault(params['query'], {'latencies': [], 'rows': 0, 'errors': 0, 'late': 0})
+            if error:
+                entry['errors'] += 1
+            else:
+                entry['latencies'].append(finished - started)
+                entry['rows'] += rows
+            if started - scheduled > 0.001:
+                entry['late'] += 1
+
+    started = time.perf_counter()
+    with open(args.workload) as f, ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        for i, line in enumerate(line for line in f if line.strip()):
+            scheduled = started + i / args.rate if args.rate > 0 else time.perf_counter()
+            delay = scheduled - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            pool.submit(execute, _replay_params(line), scheduled)
+    seconds = time.perf_counter() - started
+
+    report = {'seconds': round(seconds, 3), 'rate': args.rate, 'queries': {}}
+    for query, entry in stats.items():
+        summary = bench.summarize(entry['latencies'], entry['rows'], entry['errors'], seconds)
+        summary['late'] = entry['late']
+        report['queries'][query] = summary
+    print(to_json(report))
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Logistics app on Cassandra (interactive menu without a command)")
+    commands = parser.add_subparsers(dest='command')
+
+    migrate = commands.add_parser('migrate', help="create the keyspace and any missing tables, print what was created")
+    migrate.set_defaults(handler=migrate_command)
+
+    load = commands.add_parser('load', help="generate and load orders with a process pool, print a JSON summary")
+    load.add_argument('orders', type=int)
+    load.add_argument('--processes', type=int, default=None, help="worker processes (default: CPU count)")
+    load.add_argument('--seed', type=int, default=None,
+                      help="base seed: picks the block of order numbers and, with each worker's first order, "
+                           "the worker's seed (parallel_load.worker_seed)")
+    load.add_argument('--products-per-order', type=int, default=model.PRODUCTS_PER_ORDER)
+    load.add_argument('--shipments-per-order', type=int, default=model.SHIPMENTS_PER_ORDER)
+    load.add_argument('--first-order', type=int, default=None,
+                      help="first sequential order number (default: a block picked by the seed)")
+    load.set_defaults(handler=load_command)
 
+    query = commands.add_parser('query', help="run one query and print its rows as JSON")
+    query.add_argument('query', choices=QUERIES)
+    query.add_argument('--email')
+    query.add_argument('--order')
+    query.add_argument('--status')
+    query.add_argument('--type', dest='ship_type')
+    query.add_argument('--from', dest='start_date', type=model.parse_date, metavar='YYYY-MM-DD')
+    query.add_argument('--to', dest='end_date', type=model.parse_date, metavar='YYYY-MM-DD')
+    query.add_argument('--page-size', type=int, default=model.PAGE_SIZE)
+    query.add_argument('--paged', action='store_true',
+                       help="return only the first page of --page-size rows and its paging_state")
+    query.add_argument('--paging-state', help="paging_state of the previous page, to fetch the next one")
+    query.set_defaults(handler=query_command)
+
+    replay = commands.add_parser('replay', help="replay a JSON-lines workload file at a target rate")
+    replay.add_argument('workload')
+    replay.add_argument('--rate', type=float, default=0, help="queries per second (default: unthrottled)")
+    replay.add_argument('--concurrency', type=int, default=16)
+    replay.set_defaults(handler=replay_command)
+
+    status = commands.add_parser('update-status', help="move a shipment to a new status in every shipments table")
+    status.add_argument('order')
+    status.add_argument('shipment_date', type=uuid.UUID, help="the shipment's timeuuid")
+    status.add_argument('status', choices=model.SHIPMENT_STATUSES)
+    status.add_argument('--email', help="the order's customer, to update its summary too")
+    status.add_argument('--order-date', type=uuid.UUID,
+                        help="the order's timeuuid, with --email (default: looked up in the customer's orders)")
+    status.set_defaults(handler=update_status_command)
+
+    check = commands.add_parser('check', help="recompute order summaries from the base tables, print a JSON report")
+    check.add_argument('--email', action='append', help="customer to check (repeatable; default: sample customers)")
+    check.add_argument('--repair', action='store_true', help="rewrite missing and stale summaries")
+    check.set_defaults(handler=check_command)
+
+    dump = commands.add_parser('export', help="export tables to Parquet/Arrow files with token-range scans")
+    dump.add_argument('out_dir')
+    dump.add_argument('--format', choices=export.FORMATS, default='parquet')
+    dump.add_argument('--tables', help=f"comma-separated tables (default: all of {', '.join(export.TABLES)})")
+    dump.add_argument('--splits', type=int, default=export.SPLITS, help="token ranges per table")
+    dump.add_argument('--parallelism', type=int, default=export.PARALLELISM, help="token ranges scanned at once")
+    dump.add_argument('--fetch-size', type=int, default=export.FETCH_SIZE, help="rows per page")
+    dump.set_defaults(handler=export_command)
+
+    return parser.parse_args(argv)
+
+def menu(session):
     customer_email = set_customer_email()
+    cents = model.get_statements(session).money_cents
 
     while(True):
         print("\n" + "="*50)
@@ -87,39 +336,46 @@ def main():
 
         elif option == 1:
             print(f"\nQ1: Getting orders for customer: {customer_email}")
-            model.get_orders_by_customer(session, customer_email)
+            orders = model.get_orders_by_customer(session, customer_email)
+            render.print_orders(customer_email, orders, cents)
 
         elif option == 2:
             order_number = get_order_number()
-            model.get_products_by_order(session, order_number)
+            products = model.get_products_by_order(session, order_number)
+            render.print_products(order_number, products, cents)
 
         elif option == 3:
             order_number = get_order_number()
-            model.get_shipments_by_order(session, order_number)
+            shipments = model.get_shipments_by_order(session, order_number)
+            render.print_shipments(order_number, shipments, cents=cents)
 
         elif option == 4:
             order_number = get_order_number()
-            start_date, end_date = model.get_date_range()
-            model.get_shipments_by_order_date_range(session, order_number, start_date, end_date)
+            start_date, end_date = get_date_range()
+            shipments = model.get_shipments_by_order_date_range(session, order_number, start_date, end_date)
+            render.print_shipments(order_number, shipments, date_range=True, cents=cents)
 
         elif option == 5:
             order_number = get_order_number()
             status = get_shipment_status()
-            start_date, end_date = model.get_date_range()
-            model.get_shipments_by_order_status(session, order_number, status, start_date, end_date)
+            start_date, end_date = get_date_range()
+            shipments = model.get_shipments_by_order_status(session, order_number, status, start_date, end_date)
+            render.print_shipments(order_number, shipments, status=status, cents=cents)
 
         elif option == 6:
             order_number = get_order_number()
             ship_type = get_shipment_type()
-            start_date, end_date = model.get_date_range()
-            model.get_shipments_by_order_type(session, order_number, ship_type, start_date, end_date)
+            start_date, end_date = get_date_range()
+            shipments = model.get_shipments_by_order_type(session, order_number, ship_type, start_date, end_date)
+            render.print_shipments(order_number, shipments, ship_type=ship_type, cents=cents)
 
         elif option == 7:
             order_number = get_order_number()
             ship_type = get_shipment_type()
             status = get_shipment_status()
-            start_date, end_date = model.get_date_range()
-            model.get_shipments_by_order_type_status(session, order_number, ship_type, status, start_date, end_date)
+            start_date, end_date = get_date_range()
+            shipments = model.get_shipments_by_order_type_status(session, order_number, ship_type, status, start_date, end_date)
+            render.print_shipments(order_number, shipments, ship_type=ship_type, status=status, cents=cents)
 
         elif option == 8:
             customer_email = set_customer_email()
@@ -131,5 +387,28 @@ def main():
         else:
             print("Invalid option. Please try again.")
 
+def main():
+    args = parse_args()
+    if args.command == 'migrate':
+        migrate_command(args)
+        return
+    try:
+        cluster, session = connect(args.command in MIGRATE_COMMANDS)
+    except ValueError as exc:
+        print(to_json({'error': str(exc)}))
+        sys.exit(1)
+    if args.command is None:
+        # Long-lived: prepare every statement up front instead of on first use
+        model.get_statements(session).prepare_all()
+        menu(session)
+    else:
+        try:
+            args.handler(session, args)
+        except ValueError as exc:
+            print(to_json({'error': str(exc)}))
+            sys.exit(1)
+        finally:
+            cluster.shutdown()
+
 if __name__ == '__main__':
     main()
\ No newline at end of file
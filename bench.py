@@ -0,0 +1,181 @@
+#!/usr/bin/env python3
+import argparse
+import datetime
+import itertools
+import json
+import logging
+import os
+import random
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import config
+import model
+
+# Set logger
+log = logging.getLogger()
+
+KEYSPACE = os.getenv('CASSANDRA_BENCH_KEYSPACE', 'logistics_bench')
+
+RANGE_DAYS = 90
+
+# Random query parameters over a dataset loaded with sequential order numbers
+class Workload:
+    def __init__(self, orders_num, rng):
+        self.orders_num = orders_num
+        self.rng = rng
+
+    def email(self):
+        return self.rng.choice(model.CUSTOMERS)[0]
+
+    def order_number(self):
+        return model.sequential_order_number(self.rng.randrange(self.orders_num))
+
+    def status(self):
+        return self.rng.choice(model.SHIPMENT_STATUSES)
+
+    def ship_type(self):
+        return self.rng.choice(model.SHIPMENT_TYPES)
+
+    def date_range(self):
+        days = (model.DATE_TO - model.DATE_FROM).days - RANGE_DAYS
+        start = model.DATE_FROM.date() + datetime.timedelta(days=self.rng.randrange(days))
+        return start, start + datetime.timedelta(days=RANGE_DAYS)
+
+def _shipments(session, w, status=False, ship_type=False, date_range=False):
+    start_date, end_date = w.date_range() if date_range else (None, None)
+    return model.find_shipments(session, w.order_number(),
+                                ship_status=w.status() if status else None,
+                                ship_type=w.ship_type() if ship_type else None,
+                                start_date=start_date, end_date=end_date)
+
+# Access patterns by name: query(session, workload) -> list of records
+PATTERNS = {
+    'q1': lambda session, w: model.get_orders_by_customer(session, w.email()),
+    'q2': lambda session, w: model.get_products_by_order(session, w.order_number()),
+    'q3.1': lambda session, w: _shipments(session, w),
+    'q3.2': lambda session, w: _shipments(session, w, date_range=True),
+    'q3.3': lambda session, w: _shipments(session, w, status=True),
+    'q3.3_range': lambda session, w: _shipments(session, w, status=True, date_range=True),
+    'q3.4': lambda session, w: _shipments(session, w, ship_type=True),
+    'q3.4_range': lambda session, w: _shipments(session, w, ship_type=True, date_range=True),
+    'q3.5': lambda session, w: _shipments(session, w, status=True, ship_type=True),
+    'q3.5_range': lambda session, w: _shipments(session, w, status=True, ship_type=True, date_range=True),
+}
+
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return 0.0
+    rank = max(0, min(len(sorted_values) - 1, int(round(pct / 100.0 * len(sorted_values))) - 1))
+    return sorted_values[rank]
+
+def summarize(latencies, rows, errors, seconds):
+    latencies.sort()
+    ops = len(latencies)
+    return {
+        'ops': ops,
+        'errors': errors,
+        'rows': rows,
+        'seconds': round(seconds, 3),
+        'ops_per_sec': round(ops / seconds if seconds else 0.0, 1),
+        'rows_per_sec': round(rows / seconds if seconds else 0.0, 1),
+        'p50_ms': round(percentile(latencies, 50) * 1000, 3),
+        'p95_ms': round(percentile(latencies, 95) * 1000, 3),
+        'p99_ms': round(percentile(latencies, 99) * 1000, 3),
+        'max_ms': round(latencies[-1] * 1000 if latencies else 0.0, 3),
+    }
+
+def run_pattern(session, query, orders_num, ops, concurrency, seed):
+    issued = itertools.count()
+
+    def worker(index):
+        workload = Workload(orders_num, random.Random(seed + index))
+        latencies, rows, errors = [], 0, 0
+        while next(issued) < ops:
+            started = time.perf_counter()
+            try:
+                rows += len(query(session, workload))
+            except Exception as exc:
+                log.warning(f"Benchmark query failed: {exc!r}")
+                errors += 1
+                continue
+            latencies.append(time.perf_counter() - started)
+        return latencies, rows, errors
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        results = list(pool.map(worker, range(concurrency)))
+    seconds = time.perf_counter() - started
+
+    latencies = [latency for result in results for latency in result[0]]
+    return summarize(latencies, sum(r[1] for r in results), sum(r[2] for r in results), seconds)
+
+def load(session, args):
+    started = time.perf_counter()
+    results = model.bulk_insert(session, args.orders, args.products_per_order, args.shipments_per_order,
+                                seed=args.seed, first_order=0)
+    seconds = time.perf_counter() - started
+    rows = sum(stats.written for stats in results)
+    return {
+        'rows': rows,
+        'seconds': round(seconds, 3),
+        'rows_per_sec': round(rows / seconds if seconds else 0.0, 1),
+        'tables': {stats.label: stats.written for stats in results},
+    }
+
+def run(session, args):
+    report = {'config': vars(args).copy()}
+    if not args.skip_load:
+        report['load'] = load(session, args)
+
+    model.get_statements(session).prepare_all()
+    report['queries'] = {}
+    for name in args.patterns:
+        log.info(f"Benchmarking {name}")
+        if args.warmup:
+            run_pattern(session, PATTERNS[name], args.orders, args.warmup, args.concurrency, args.seed)
+        report['queries'][name] = run_pattern(session, PATTERNS[name], args.orders, args.ops,
+                                              args.concurrency, args.seed)
+    return report
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Latency/throughput benchmark for the Q1-Q3.5 access patterns")
+    parser.add_argument('--orders', type=int, default=1000, help="orders in the dataset")
+    parser.add_argument('--products-per-order', type=int, default=model.PRODUCTS_PER_ORDER)
+    parser.add_argument('--shipments-per-order', type=int, default=model.SHIPMENTS_PER_ORDER)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--skip-load', action='store_true', help="reuse a dataset loaded by a previous run")
+    parser.add_argument('--ops', type=int, default=1000, help="operations per access pattern")
+    parser.add_argument('--warmup', type=int, default=100, help="untimed operations before each pattern")
+    parser.add_argument('--concurrency', type=int, default=16, help="concurrent client threads")
+    parser.add_argument('--patterns', type=lambda value: value.split(','), default=list(PATTERNS),
+                        help=f"comma separated subset of {','.join(PATTERNS)}")
+    parser.add_argument('--output', help="write the JSON report to this file instead of stdout")
+    args = parser.parse_args(argv)
+    unknown = [name for name in args.patterns if name not in PATTERNS]
+    if unknown:
+        parser.error(f"unknown patterns: {', '.join(unknown)}")
+    return args
+
+def main(argv=None):
+    args = parse_args(argv)
+    logging.basicConfig(level='WARNING', format="%(asctime)s [%(levelname)s] %(name)s: %(message)s")
+
+    settings = config.load_config(keyspace=KEYSPACE)
+    cluster, session = config.connect(settings, migrate=True)
+    try:
+        report = run(session, args)
+        report['backend'] = settings['backend']
+    finally:
+        cluster.shutdown()
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output + '\n')
+    else:
+        print(output)
+
+if __name__ == '__main__':
+    sys.exit(main())
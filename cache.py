@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+import collections
+import threading
+import time
+
+MAX_ENTRIES = 1024
+DEFAULT_TTL = 60.0
+
+class QueryCache:
+    # Read-through cache for query results, keyed by statement name and bound
+    # parameters. Least recently used entries are evicted past max_entries and
+    # entries expire after the TTL of their statement (ttls, else default_ttl).
+    # Every entry is indexed by its partition key (the first bound parameter) so
+    # writes can drop all cached results for an order_number or email at once.
+    # A miss returns the cache's generation in place of the value; put skips the
+    # store when the partition was invalidated after that generation, so rows read
+    # before a write never land in the cache after the write's invalidation.
+    def __init__(self, max_entries=MAX_ENTRIES, default_ttl=DEFAULT_TTL, ttls=None):
+        self.max_entries = max_entries
+        self.default_ttl = default_ttl
+        self.ttls = dict(ttls or {})
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+        self.discarded = 0
+        self._entries = collections.OrderedDict()
+        self._by_partition = collections.defaultdict(set)
+        # Generation of each partition key's last invalidation, oldest first. At most
+        # max_entries are kept; a put older than the last one forgotten is discarded.
+        self._generation = 0
+        self._invalidated = collections.OrderedDict()
+        self._oldest_generation = 0
+        self._lock = threading.Lock()
+
+    def get(self, name, params):
+        key = (name, tuple(params))
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] > time.monotonic():
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return True, entry[1]
+            if entry is not None:
+                self._remove(key)
+            self.misses += 1
+            return False, self._generation
+
+    def put(self, name, params, value, generation=None):
+        # generation: what get returned on the miss that read value
+        key = (name, tuple(params))
+        expires = time.monotonic() + self.ttls.get(name, self.default_ttl)
+        with self._lock:
+            if generation is not None and (generation < self._oldest_generation
+                                           or self._invalidated.get(key[1][0], -1) > generation):
+                self.discarded += 1
+                return
+            self._entries[key] = (expires, value)
+            self._entries.move_to_end(key)
+            self._by_partition[key[1][0]].add(key)
+            while len(self._entries) > self.max_entries:
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+
+    def invalidate(self, partition_key):
+        with self._lock:
+            self._generation += 1
+            self._invalidated[partition_key] = self._generation
+            self._invalidated.move_to_end(partition_key)
+            while len(self._invalidated) > self.max_entries:
+                self._oldest_generation = self._invalidated.popitem(last=False)[1]
+            for key in self._by_partition.pop(partition_key, ()):
+                self._entries.pop(key, None)
+                self.invalidations += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._by_partition.clear()
+            self._generation += 1
+            self._invalidated.clear()
+            self._oldest_generation = self._generation
+
+    def stats(self):
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'invalidations': self.invalidations,
+                'discarded': self.discarded,
+            }
+
+    def _remove(self, key):
+        self._entries.pop(key, None)
+        keys = self._by_partition.get(key[1][0])
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self._by_partition[key[1][0]]
@@ -0,0 +1,198 @@
+#!/usr/bin/env python3
+import json
+import logging
+import os
+
+from cassandra import ConsistencyLevel
+from cassandra.cluster import EXEC_PROFILE_DEFAULT, Cluster, ExecutionProfile
+from cassandra.policies import ConstantSpeculativeExecutionPolicy, DCAwareRoundRobinPolicy, HostDistance, TokenAwarePolicy
+from cassandra.query import named_tuple_factory, tuple_factory
+
+import loader
+import model
+
+# Set logger
+log = logging.getLogger()
+
+# Execution profiles: OLTP reads use the default profile, bulk writes their own
+OLTP_PROFILE = EXEC_PROFILE_DEFAULT
+BULK_PROFILE = loader.BULK_PROFILE
+
+# Settings, their defaults and the env var overriding each one. A JSON file named
+# by CASSANDRA_CONFIG may set any of them too; env vars win over the file.
+SETTINGS = {
+    'contact_points': ('127.0.0.1', 'CASSANDRA_CLUSTER_IPS'),
+    'port': (9042, 'CASSANDRA_PORT'),
+    'keyspace': ('logistics', 'CASSANDRA_KEYSPACE'),
+    'replication_factor': (1, 'CASSANDRA_REPLICATION_FACTOR'),
+    'local_dc': (None, 'CASSANDRA_LOCAL_DC'),
+    'protocol_version': (None, 'CASSANDRA_PROTOCOL_VERSION'),
+    'connect_timeout': (5.0, 'CASSANDRA_CONNECT_TIMEOUT'),
+    'executor_threads': (2, 'CASSANDRA_EXECUTOR_THREADS'),
+    'core_connections': (None, 'CASSANDRA_CORE_CONNECTIONS'),
+    'max_connections': (None, 'CASSANDRA_MAX_CONNECTIONS'),
+    'read_consistency': ('LOCAL_ONE', 'CASSANDRA_READ_CONSISTENCY'),
+    'read_timeout': (2.0, 'CASSANDRA_READ_TIMEOUT'),
+    'speculative_delay': (0.05, 'CASSANDRA_SPECULATIVE_DELAY'),
+    'speculative_attempts': (2, 'CASSANDRA_SPECULATIVE_ATTEMPTS'),
+    'write_consistency': ('LOCAL_ONE', 'CASSANDRA_WRITE_CONSISTENCY'),
+    'write_timeout': (30.0, 'CASSANDRA_WRITE_TIMEOUT'),
+    'query_cache_size': (0, 'CASSANDRA_QUERY_CACHE_SIZE'),
+    'query_cache_ttl': (60.0, 'CASSANDRA_QUERY_CACHE_TTL'),
+    'metrics_port': (None, 'CASSANDRA_METRICS_PORT'),
+    'metrics_file': (None, 'CASSANDRA_METRICS_FILE'),
+    'metrics_interval': (15.0, 'CASSANDRA_METRICS_INTERVAL'),
+    'driver_metrics': (False, 'CASSANDRA_DRIVER_METRICS'),
+    'bucketed': (False, 'CASSANDRA_BUCKETED'),
+    'money_cents': (False, 'CASSANDRA_MONEY_CENTS'),
+    'row_factory': ('named_tuple', 'CASSANDRA_ROW_FACTORY'),
+    'backend': ('cassandra', 'CASSANDRA_BACKEND'),
+    'memory_latency': (0.0, 'CASSANDRA_MEMORY_LATENCY'),
+    'memory_jitter': (0.0, 'CASSANDRA_MEMORY_JITTER'),
+}
+
+INT_SETTINGS = {'port', 'replication_factor', 'protocol_version', 'executor_threads', 'core_connections',
+                'max_connections', 'speculative_attempts', 'query_cache_size', 'metrics_port'}
+FLOAT_SETTINGS = {'connect_timeout', 'read_timeout', 'speculative_delay', 'write_timeout', 'query_cache_ttl',
+                  'metrics_interval', 'memory_latency', 'memory_jitter'}
+BOOL_SETTINGS = {'driver_metrics', 'bucketed', 'money_cents'}
+
+# 'cassandra' talks to the cluster at contact_points; 'memory' is the in-process
+# stand-in of memstore.py, with memory_latency + random(0, memory_jitter) seconds
+# injected per request
+BACKENDS = ('cassandra', 'memory')
+
+# Row factory of the OLTP profile. The model reads rows by position, so 'tuple'
+# skips the namedtuple class the driver builds for every page; the bulk profile
+# (exports) always uses it.
+ROW_FACTORIES = {'named_tuple': named_tuple_factory, 'tuple': tuple_factory}
+
+def _convert(name, value):
+    if value is None or value == '':
+        return None
+    if name in BOOL_SETTINGS:
+        return value if isinstance(value, bool) else value.lower() in ('1', 'true', 'yes', 'on')
+    if name in INT_SETTINGS:
+        return int(value)
+    if name in FLOAT_SETTINGS:
+        return float(value)
+    return value
+
+def load_config(path=None, **overrides):
+    config = {name: default for name, (default, _) in SETTINGS.items()}
+
+    path = path or os.getenv('CASSANDRA_CONFIG')
+    if path:
+        with open(path) as f:
+            file_config = json.load(f)
+        unknown = set(file_config) - set(SETTINGS)
+        if unknown:
+            raise ValueError(f"Unknown settings in {path}: {', '.join(sorted(unknown))}")
+        config.update(file_config)
+
+    for name, (_, env_var) in SETTINGS.items():
+        if env_var in os.environ:
+            config[name] = os.environ[env_var]
+    config.update(overrides)
+
+    config = {name: _convert(name, value) for name, value in config.items()}
+    if config['backend'] not in BACKENDS:
+        raise ValueError(f"Unknown backend {config['backend']}, expected one of: {', '.join(BACKENDS)}")
+    if config['row_factory'] not in ROW_FACTORIES:
+        raise ValueError(f"Unknown row_factory {config['row_factory']}, expected one of: {', '.join(ROW_FACTORIES)}")
+    for name in ('read_consistency', 'write_consistency'):
+        if config[name] not in ConsistencyLevel.name_to_value:
+            raise ValueError(f"Unknown {name} {config[name]}, expected one of: "
+                             f"{', '.join(ConsistencyLevel.name_to_value)}")
+    if isinstance(config['contact_points'], str):
+        config['contact_points'] = config['contact_points'].split(',')
+    return config
+
+def _load_balancing_policy(config):
+    return TokenAwarePolicy(DCAwareRoundRobinPolicy(local_dc=config['local_dc']))
+
+def execution_profiles(config):
+    speculative = None
+    if config['speculative_attempts']:
+        # Only applies to statements marked idempotent (all prepared statements here)
+        speculative = ConstantSpeculativeExecutionPolicy(config['speculative_delay'], config['speculative_attempts'])
+    oltp = ExecutionProfile(
+        load_balancing_policy=_load_balancing_policy(config),
+        consistency_level=ConsistencyLevel.name_to_value[config['read_consistency']],
+        request_timeout=config['read_timeout'],
+        speculative_execution_policy=speculative,
+        row_factory=ROW_FACTORIES[config['row_factory']],
+    )
+    bulk = ExecutionProfile(
+        load_balancing_policy=_load_balancing_policy(config),
+        consistency_level=ConsistencyLevel.name_to_value[config['write_consistency']],
+        request_timeout=config['write_timeout'],
+        row_factory=tuple_factory,
+    )
+    return {OLTP_PROFILE: oltp, BULK_PROFILE: bulk}
+
+def build_cluster(config):
+    if config['backend'] == 'memory':
+        # Imported here: only the offline backend needs it
+        import memstore
+        return memstore.Cluster(config['memory_latency'], config['memory_jitter'], execution_profiles(config))
+    kwargs = {
+        'contact_points': config['contact_points'],
+        'port': config['port'],
+        'execution_profiles': execution_profiles(config),
+        'connect_timeout': config['connect_timeout'],
+        'executor_threads': config['executor_threads'],
+    }
+    if config['protocol_version']:
+        kwargs['protocol_version'] = config['protocol_version']
+    if config['driver_metrics']:
+        try:
+            import cassandra.metrics  # noqa: F401 (needs the optional scales package)
+            kwargs['metrics_enabled'] = True
+        except ImportError:
+            log.warning("Driver metrics need the 'scales' package; continuing without them")
+    cluster = Cluster(**kwargs)
+
+    # Connection pools only exist below protocol v3; from v3 on each host gets a
+    # single multiplexed connection and these settings do not apply.
+    if config['core_connections'] or config['max_connections']:
+        if config['protocol_version'] and config['protocol_version'] < 3:
+            if config['max_connections']:
+                cluster.set_max_connections_per_host(HostDistance.LOCAL, config['max_connections'])
+            if config['core_connections']:
+                cluster.set_core_connections_per_host(HostDistance.LOCAL, config['core_connections'])
+        else:
+            log.info("Ignoring connection pool sizing: protocol v3+ uses one connection per host")
+    return cluster
+
+# With migrate, creates whatever part of the schema is missing (model.migrate);
+# otherwise the keyspace must exist and nothing but the connection is set up.
+# A memory backend starts empty, so it is always migrated.
+def connect(config, migrate=False):
+    cluster = build_cluster(config)
+    if migrate or config['backend'] == 'memory':
+        session = cluster.connect()
+        model.migrate(session, config['keyspace'], config['replication_factor'], config['bucketed'],
+                      config['money_cents'])
+        return cluster, session
+    # Connecting with the keyspace opens every pool on it directly, with no USE
+    # round trip afterwards. When that fails the control connection has usually
+    # loaded the schema already, which tells a missing keyspace apart.
+    try:
+        session = cluster.connect(config['keyspace'])
+    except Exception:
+        keyspaces = cluster.metadata.keyspaces
+        cluster.shutdown()
+        if keyspaces and config['keyspace'] not in keyspaces:
+            raise ValueError(f"Keyspace {config['keyspace']} does not exist, run 'app.py migrate' first") from None
+        raise
+    try:
+        model.check_money_columns(cluster.metadata.keyspaces[config['keyspace']].tables, config['money_cents'])
+    except ValueError:
+        cluster.shutdown()
+        raise
+    if config['bucketed']:
+        model.enable_buckets(session)
+    if config['money_cents']:
+        model.enable_money_cents(session)
+    return cluster, session
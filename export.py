@@ -0,0 +1,313 @@
+#!/usr/bin/env python3
+import decimal
+import logging
+import os
+import queue
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from cassandra import OperationTimedOut, ReadTimeout
+
+import loader
+import model
+
+# Set logger
+log = logging.getLogger()
+
+# Murmur3Partitioner token ring. The partitioner never yields MIN_TOKEN for a key,
+# so the ranges (start, end] below cover every partition.
+MIN_TOKEN = -2 ** 63
+MAX_TOKEN = 2 ** 63 - 1
+
+SPLITS = 64
+PARALLELISM = 8
+FETCH_SIZE = 1000
+# Pages waiting for the writer; scans block beyond this, so memory stays flat
+MAX_QUEUED_PAGES = 16
+# Rows per Parquet row group. Pages are buffered up to this many rows, so row
+# groups are large enough for readers to scan efficiently whatever fetch_size is.
+ROW_GROUP_SIZE = 65536
+MAX_RETRIES = 5
+RETRY_BASE_DELAY = 0.1
+PROGRESS_INTERVAL = 5.0
+
+RETRYABLE_ERRORS = (ReadTimeout, OperationTimedOut)
+
+# Table and partition key columns of every exportable table
+TABLES = {
+    'orders_by_customers': 'email',
+    'order_summaries_by_customer': 'email',
+    'products_by_order': 'order_number',
+}
+TABLES.update((table, 'order_number') for table in model.SHIPMENT_TABLES)
+# Time-bucketed layout: the same tables partitioned by key and month
+BUCKETED_TABLES = {table: key for table, key in TABLES.items() if table not in model.BUCKETED_TABLES}
+BUCKETED_TABLES.update((table + model.BUCKET_SUFFIX, TABLES[table] + ', bucket') for table in model.BUCKETED_TABLES)
+BUCKETED_TABLES['partition_buckets'] = 'table_name, partition_key'
+
+FORMATS = {'parquet': '.parquet', 'arrow': '.arrow'}
+
+SELECT_TOKEN_RANGE = "SELECT * FROM {0} WHERE token({1}) > ? AND token({1}) <= ?"
+
+_END = object()
+
+class _ScanError:
+    def __init__(self, error):
+        self.error = error
+
+def token_ranges(splits=SPLITS):
+    # splits contiguous (start, end] ranges of about the same width over the whole ring
+    width = (MAX_TOKEN - MIN_TOKEN) // splits
+    start = MIN_TOKEN
+    for i in range(splits):
+        end = MAX_TOKEN if i == splits - 1 else start + width
+        yield start, end
+        start = end
+
+# DECIMAL columns export as decimal128(38, DECIMAL_SCALE): exact for money amounts.
+# Floats bound to a DECIMAL column are stored as their full binary expansion; those
+# are rounded at 1e-10, not to a float's 15-17 significant digits.
+DECIMAL_SCALE = 10
+_DECIMAL_QUANTUM = decimal.Decimal(1).scaleb(-DECIMAL_SCALE)
+_DECIMAL_CONTEXT = decimal.Context(prec=38)
+
+def _to_decimal(value):
+    return value.quantize(_DECIMAL_QUANTUM, context=_DECIMAL_CONTEXT)
+
+def _arrow_types(pa):
+    # CQL type name -> (Arrow type, value converter)
+    return {
+        'ascii': (pa.string(), None),
+        'text': (pa.string(), None),
+        'varchar': (pa.string(), None),
+        'uuid': (pa.string(), str),
+        'timeuuid': (pa.string(), str),
+        'decimal': (pa.decimal128(38, DECIMAL_SCALE), _to_decimal),
+        'float': (pa.float32(), None),
+        'double': (pa.float64(), None),
+        'int': (pa.int32(), None),
+        'bigint': (pa.int64(), None),
+        'boolean': (pa.bool_(), None),
+        'timestamp': (pa.timestamp('ms'), None),
+        'date': (pa.date32(), lambda value: value.date()),
+    }
+
+def _import_pyarrow(fmt):
+    try:
+        import pyarrow
+        import pyarrow.ipc  # noqa: F401
+        if fmt == 'parquet':
+            import pyarrow.parquet  # noqa: F401
+    except ImportError:
+        raise ValueError("Exporting needs the optional 'pyarrow' package (pip install pyarrow)")
+    return pyarrow
+
+class _Writer:
+    # Turns pages of rows into Arrow record batches written to a Parquet or Arrow IPC
+    # file. Parquet batches are written in row groups of row_group_size rows.
+    def __init__(self, pa, fmt, path, columns, row_group_size=ROW_GROUP_SIZE):
+        arrow_types = _arrow_types(pa)
+        fields, self.converters = [], []
+        for name, cql_type in columns:
+            if cql_type not in arrow_types:
+                raise ValueError(f"Column {name} has unsupported type {cql_type} for export")
+            arrow_type, converter = arrow_types[cql_type]
+            fields.append(pa.field(name, arrow_type))
+            self.converters.append(converter)
+        self.pa = pa
+        self.schema = pa.schema(fields)
+        self.row_group_size = row_group_size
+        self.pending = []
+        self.pending_rows = 0
+        if fmt == 'parquet':
+            self.writer = pa.parquet.ParquetWriter(path, self.schema)
+        else:
+            self.writer = pa.ipc.new_file(path, self.schema)
+            self.row_group_size = None
+
+    def write(self, rows):
+        arrays = []
+        for i, (field, converter) in enumerate(zip(self.schema, self.converters)):
+            values = [row[i] for row in rows]
+            if converter is not None:
+                values = [None if value is None else converter(value) for value in values]
+            arrays.append(self.pa.array(values, type=field.type))
+        batch = self.pa.RecordBatch.from_arrays(arrays, schema=self.schema)
+        if self.row_group_size is None:
+            self.writer.write_batch(batch)
+            return
+        self.pending.append(batch)
+        self.pending_rows += batch.num_rows
+        while self.pending_rows >= self.row_group_size:
+            self._flush(self.row_group_size)
+
+    def _flush(self, rows):
+        table = self.pa.Table.from_batches(self.pending, schema=self.schema)
+        self.writer.write_table(table.slice(0, rows), row_group_size=rows)
+        rest = table.slice(rows)
+        self.pending = rest.to_batches()
+        self.pending_rows = rest.num_rows
+
+    def close(self):
+        if self.pending_rows:
+            self._flush(self.pending_rows)
+        self.writer.close()
+
+class TableExport:
+    # Scans one table by token ranges on a pool of parallelism threads. Every range
+    # is paged with fetch_size rows per request and each page is handed to a single
+    # writer (the calling thread) through a queue of at most MAX_QUEUED_PAGES pages.
+    def __init__(self, session, table, splits=SPLITS, parallelism=PARALLELISM, fetch_size=FETCH_SIZE,
+                 execution_profile=loader.BULK_PROFILE):
+        tables = BUCKETED_TABLES if model.get_statements(session).bucketed else TABLES
+        if table not in tables:
+            raise ValueError(f"Unknown table {table}, expected one of: {', '.join(tables)}")
+        self.partition_key = tables[table]
+        self.session = session
+        self.table = table
+        self.splits = splits
+        self.parallelism = parallelism
+        self.fetch_size = fetch_size
+        # Long scans use the bulk profile (longer request timeout) when it is defined
+        self.execution_profile = loader.bulk_profile(session, execution_profile)
+        self.rows = 0
+        self.pages = 0
+        self.retries = 0
+        self.ranges_done = 0
+        self._lock = threading.Lock()
+        self._cancelled = threading.Event()
+
+    def run(self, pa, fmt, path):
+        stmt = self.session.prepare(SELECT_TOKEN_RANGE.format(self.table, self.partition_key))
+        stmt.is_idempotent = True
+        columns = [(column.name, column.type.typename) for column in stmt.result_metadata]
+        pages = queue.Queue(maxsize=MAX_QUEUED_PAGES)
+        ranges = list(token_ranges(self.splits))
+
+        writer = _Writer(pa, fmt, path, columns)
+        try:
+            with ThreadPoolExecutor(max_workers=self.parallelism) as pool:
+                try:
+                    for token_range in ranges:
+                        pool.submit(self._scan, stmt, token_range, pages)
+                    remaining = len(ranges)
+                    while remaining:
+                        page = pages.get()
+                        if page is _END:
+                            remaining -= 1
+                        elif isinstance(page, _ScanError):
+                            raise page.error
+                        elif page:
+                            writer.write(page)
+                finally:
+                    self._cancelled.set()
+        finally:
+            writer.close()
+
+    def _put(self, pages, item):
+        while not self._cancelled.is_set():
+            try:
+                pages.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                continue
+
+    def _scan(self, stmt, token_range, pages):
+        paging_state = None
+        attempt = 0
+        try:
+            while not self._cancelled.is_set():
+                bound = stmt.bind(token_range)
+                bound.fetch_size = self.fetch_size
+                try:
+                    result = self.session.execute(bound, paging_state=paging_state,
+                                                  execution_profile=self.execution_profile)
+                except RETRYABLE_ERRORS as exc:
+                    if attempt >= MAX_RETRIES:
+                        raise
+                    # Resume the range from the last page that was read
+                    delay = RETRY_BASE_DELAY * (2 ** attempt) * (1 + random.random())
+                    attempt += 1
+                    with self._lock:
+                        self.retries += 1
+                    log.warning(f"Retrying {self.table} scan of {token_range} in {delay:.2f}s after {exc!r}")
+                    time.sleep(delay)
+                    continue
+                attempt = 0
+                rows = result.current_rows
+                with self._lock:
+                    self.rows += len(rows)
+                    self.pages += 1
+                self._put(pages, rows)
+                paging_state = result.paging_state
+                if paging_state is None:
+                    break
+            with self._lock:
+                self.ranges_done += 1
+            self._put(pages, _END)
+        except Exception as exc:
+            self._put(pages, _ScanError(exc))
+
+def export_table(session, table, out_dir, fmt='parquet', splits=SPLITS, parallelism=PARALLELISM,
+                 fetch_size=FETCH_SIZE):
+    pa = _import_pyarrow(fmt)
+    path = os.path.join(out_dir, table + FORMATS[fmt])
+    # Written under a temporary name so readers never see a partial file
+    partial = path + '.partial'
+    scan = TableExport(session, table, splits, parallelism, fetch_size)
+
+    stop = threading.Event()
+
+    def report_progress():
+        while not stop.wait(PROGRESS_INTERVAL):
+            log.info(f"Export {table}: {scan.rows} rows, {scan.ranges_done}/{splits} ranges, {scan.retries} retries")
+
+    started = time.perf_counter()
+    threading.Thread(target=report_progress, daemon=True).start()
+    try:
+        scan.run(pa, fmt, partial)
+        os.replace(partial, path)
+    except BaseException:
+        if os.path.exists(partial):
+            os.remove(partial)
+        raise
+    finally:
+        stop.set()
+    seconds = time.perf_counter() - started
+
+    summary = {
+        'table': table,
+        'path': path,
+        'rows': scan.rows,
+        'pages': scan.pages,
+        'retries': scan.retries,
+        'bytes': os.path.getsize(path),
+        'seconds': round(seconds, 3),
+        'rows_per_sec': round(scan.rows / seconds if seconds else 0.0, 1),
+    }
+    log.info(f"Exported {summary}")
+    return summary
+
+# Exports each table to out_dir/<table>.parquet (or .arrow), one table after another
+def export(session, out_dir, tables=None, fmt='parquet', splits=SPLITS, parallelism=PARALLELISM,
+           fetch_size=FETCH_SIZE):
+    if fmt not in FORMATS:
+        raise ValueError(f"Unknown format {fmt}, expected one of: {', '.join(FORMATS)}")
+    tables = list(tables or (BUCKETED_TABLES if model.get_statements(session).bucketed else TABLES))
+    os.makedirs(out_dir, exist_ok=True)
+
+    started = time.perf_counter()
+    results = [export_table(session, table, out_dir, fmt, splits, parallelism, fetch_size) for table in tables]
+    seconds = time.perf_counter() - started
+
+    rows = sum(result['rows'] for result in results)
+    return {
+        'format': fmt,
+        'rows': rows,
+        'bytes': sum(result['bytes'] for result in results),
+        'seconds': round(seconds, 3),
+        'rows_per_sec': round(rows / seconds if seconds else 0.0, 1),
+        'tables': results,
+    }
@@ -0,0 +1,267 @@
+#!/usr/bin/env python3
+import logging
+import queue
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from cassandra import OperationTimedOut, WriteTimeout
+from cassandra.cluster import EXEC_PROFILE_DEFAULT
+from cassandra.query import BatchStatement, BatchType
+
+import metrics
+
+# Set logger
+log = logging.getLogger()
+
+MAX_IN_FLIGHT = 128
+BATCH_SIZE = 10
+MAX_PENDING_PARTITIONS = 1024
+MAX_RETRIES = 5
+RETRY_BASE_DELAY = 0.05
+PROGRESS_INTERVAL = 5.0
+
+RETRYABLE_ERRORS = (WriteTimeout, OperationTimedOut)
+
+# Execution profile used for writes when the cluster defines it (see config.py)
+BULK_PROFILE = 'bulk'
+
+def bulk_profile(session, name=BULK_PROFILE):
+    # The named profile if the session's cluster defines it, the default one otherwise
+    return name if name in session.cluster.profile_manager.profiles else EXEC_PROFILE_DEFAULT
+
+_END = object()
+
+class StreamCancelled(RuntimeError):
+    # Raised by a split_stream iterator after another one stopped early
+    pass
+
+class _StreamError:
+    def __init__(self, error):
+        self.error = error
+
+def split_stream(records, splitters, chunk_size=1000):
+    # Fans one stream of records out to one row iterator per splitter. A producer
+    # thread pulls records and queues splitter(record) rows in chunks of chunk_size
+    # records, each queue holding at most two chunks, so memory stays flat however
+    # long the stream is and the consumers can run concurrently.
+    queues = [queue.Queue(maxsize=2) for _ in splitters]
+    cancelled = threading.Event()
+
+    def put(q, item):
+        while not cancelled.is_set():
+            try:
+                q.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                continue
+
+    def produce():
+        chunks = [[] for _ in splitters]
+        count = 0
+        try:
+            for record in records:
+                for chunk, split in zip(chunks, splitters):
+                    chunk.extend(split(record))
+                count += 1
+                if count >= chunk_size:
+                    for q, chunk in zip(queues, chunks):
+                        put(q, chunk)
+                    chunks = [[] for _ in splitters]
+                    count = 0
+            for q, chunk in zip(queues, chunks):
+                if chunk:
+                    put(q, chunk)
+            end = _END
+        except Exception as exc:
+            end = _StreamError(exc)
+        for q in queues:
+            put(q, end)
+
+    def consume(q):
+        finished = False
+        try:
+            while True:
+                try:
+                    chunk = q.get(timeout=0.1)
+                except queue.Empty:
+                    if cancelled.is_set():
+                        raise StreamCancelled("Row stream cancelled by another consumer")
+                    continue
+                if chunk is _END:
+                    finished = True
+                    return
+                if isinstance(chunk, _StreamError):
+                    raise chunk.error
+                yield from chunk
+        finally:
+            if not finished:
+                cancelled.set()
+
+    threading.Thread(target=produce, daemon=True).start()
+    return [consume(q) for q in queues]
+
+class LoadStats:
+    def __init__(self, label):
+        self.label = label
+        self.metric = f"insert_{label}"
+        self.rows = 0
+        self.written = 0
+        self.requests = 0
+        self.retries = 0
+        self.seconds = 0.0
+        self._pending = 0
+        self._error = None
+        self._done = threading.Condition()
+
+    @property
+    def rows_per_sec(self):
+        return self.written / self.seconds if self.seconds else 0.0
+
+    def __repr__(self):
+        return (f"LoadStats({self.label}: {self.written}/{self.rows} rows, {self.requests} requests, "
+                f"{self.retries} retries, {self.seconds:.2f}s, {self.rows_per_sec:,.0f} rows/s)")
+
+class BulkLoader:
+    # Writes rows for prepared INSERTs. Rows are grouped by their partition key
+    # (the statement's routing key), so every request targets a single partition:
+    # an UNLOGGED batch when a partition has several rows, a plain insert otherwise.
+    # All loads share one window of max_in_flight outstanding requests; timed-out
+    # writes are retried with exponential backoff while keeping their slot.
+    # on_written(partition_key) is called once a partition's rows are acknowledged.
+    def __init__(self, session, max_in_flight=MAX_IN_FLIGHT, batch_size=BATCH_SIZE,
+                 max_retries=MAX_RETRIES, progress_interval=PROGRESS_INTERVAL, on_written=None,
+                 execution_profile=BULK_PROFILE):
+        self.session = session
+        self.on_written = on_written
+        self.execution_profile = bulk_profile(session, execution_profile)
+        self.batch_size = batch_size
+        self.max_retries = max_retries
+        self.progress_interval = progress_interval
+        self.progress = {}
+        self._slots = threading.Semaphore(max_in_flight)
+
+    def load(self, stmt, rows, label='rows'):
+        stats = LoadStats(label)
+        self.progress[label] = stats
+        key_indexes = stmt.routing_key_indexes or [0]
+        started = time.perf_counter()
+
+        pending = {}
+        try:
+            for row in rows:
+                key = tuple(row[i] for i in key_indexes)
+                group = pending.setdefault(key, [])
+                group.append(row)
+                if len(group) >= self.batch_size:
+                    self._send(stmt, key, pending.pop(key), stats)
+                elif len(pending) >= MAX_PENDING_PARTITIONS:
+                    for key, group in pending.items():
+                        self._send(stmt, key, group, stats)
+                    pending.clear()
+            for key, group in pending.items():
+                self._send(stmt, key, group, stats)
+        except BaseException:
+            # Close a split_stream iterator now: the raised exception keeps this frame
+            # (and the generator) alive, and the producer and the other tables' consumers
+            # would wait on it forever
+            close = getattr(rows, 'close', None)
+            if close is not None:
+                close()
+            raise
+
+        with stats._done:
+            while stats._pending:
+                stats._done.wait()
+        stats.seconds = time.perf_counter() - started
+        log.info(f"Loaded {stats!r}")
+        if stats._error is not None:
+            raise stats._error
+        return stats
+
+    def load_all(self, tables):
+        # tables: iterable of (stmt, rows, label); every table is written concurrently
+        tables = list(tables)
+        started = time.perf_counter()
+        stop = threading.Event()
+        reporter = threading.Thread(target=self._report_progress, args=(stop,), daemon=True)
+        reporter.start()
+        try:
+            with ThreadPoolExecutor(max_workers=len(tables)) as pool:
+                futures = [pool.submit(self.load, stmt, rows, label) for stmt, rows, label in tables]
+                errors = [future.exception() for future in futures]
+            # The table that failed first, not the ones cancelled because of it
+            errors = [error for error in errors if error is not None]
+            if errors:
+                raise next((error for error in errors if not isinstance(error, StreamCancelled)), errors[0])
+            results = [future.result() for future in futures]
+        finally:
+            stop.set()
+        elapsed = time.perf_counter() - started
+        total = sum(stats.written for stats in results)
+        log.info(f"Loaded {total} rows into {len(results)} tables in {elapsed:.2f}s ({total / elapsed if elapsed else 0:,.0f} rows/s)")
+        return results
+
+    def _report_progress(self, stop):
+        while not stop.wait(self.progress_interval):
+            for stats in list(self.progress.values()):
+                log.info(f"Progress {stats.label}: {stats.written}/{stats.rows} rows, {stats.retries} retries")
+
+    def _send(self, stmt, key, group, stats):
+        if len(group) == 1:
+            request = stmt.bind(group[0])
+        else:
+            request = BatchStatement(batch_type=BatchType.UNLOGGED)
+            for row in group:
+                request.add(stmt, row)
+        request.is_idempotent = True
+
+        self._slots.acquire()
+        with stats._done:
+            stats.rows += len(group)
+            stats.requests += 1
+            stats._pending += 1
+        self._submit(request, key, len(group), stats, 0)
+
+    def _submit(self, request, key, count, stats, attempt):
+        started = time.perf_counter()
+        try:
+            future = self.session.execute_async(request, execution_profile=self.execution_profile)
+        except Exception as exc:
+            metrics.REGISTRY.error(stats.metric, exc)
+            self._finish(stats, error=exc)
+            return
+        future.add_callbacks(self._on_success, self._on_error,
+                             callback_args=(key, count, stats, started),
+                             errback_args=(request, key, count, stats, attempt))
+
+    def _on_success(self, _rows, key, count, stats, started):
+        metrics.REGISTRY.observe(stats.metric, time.perf_counter() - started, count)
+        with stats._done:
+            stats.written += count
+        if self.on_written is not None:
+            self.on_written(key)
+        self._finish(stats)
+
+    def _on_error(self, exc, request, key, count, stats, attempt):
+        metrics.REGISTRY.error(stats.metric, exc)
+        if isinstance(exc, RETRYABLE_ERRORS) and attempt < self.max_retries:
+            metrics.REGISTRY.retry(stats.metric)
+            delay = RETRY_BASE_DELAY * (2 ** attempt) * (1 + random.random())
+            with stats._done:
+                stats.retries += 1
+            log.warning(f"Retrying {stats.label} write in {delay:.2f}s after {exc!r}")
+            timer = threading.Timer(delay, self._submit, args=(request, key, count, stats, attempt + 1))
+            timer.daemon = True
+            timer.start()
+            return
+        self._finish(stats, error=exc)
+
+    def _finish(self, stats, error=None):
+        self._slots.release()
+        with stats._done:
+            if error is not None and stats._error is None:
+                stats._error = error
+            stats._pending -= 1
+            stats._done.notify_all()
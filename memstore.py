@@ -0,0 +1,750 @@
+#!/usr/bin/env python3
+import collections
+import heapq
+import itertools
+import logging
+import random
+import re
+import struct
+import threading
+import time
+
+from cassandra import InvalidRequest
+from cassandra import cqltypes
+from cassandra.cluster import EXEC_PROFILE_DEFAULT
+from cassandra.metadata import Murmur3Token
+from cassandra.protocol import ColumnMetadata
+from cassandra.query import FETCH_SIZE_UNSET, UNSET_VALUE, BatchStatement, BoundStatement, PreparedStatement, named_tuple_factory
+from cassandra.util import Date
+
+import timeuuids
+
+# Set logger
+log = logging.getLogger()
+
+# In-process stand-in for a Cassandra cluster (config backend 'memory'), so the
+# model, loader, bench and export code can run and be profiled without a server.
+# Statements are prepared and bound by the real driver classes (the same client
+# side serialization as against a cluster) and served from dicts that follow the
+# tables' partition keys, clustering order, static columns and write timestamps.
+# Every response is delivered after latency + random(0, jitter) seconds.
+# Understands the statement shapes model.py uses: CREATE KEYSPACE/TABLE, INSERT,
+# UPDATE ... SET, DELETE of a row, and SELECT with equality on the partition key,
+# equality/ranges on clustering columns, token() ranges and toDate().
+
+PROTOCOL_VERSION = 4
+DEFAULT_FETCH_SIZE = 5000
+HOST = 'memory'
+
+CQL_TYPES = {
+    'ascii': cqltypes.AsciiType,
+    'text': cqltypes.UTF8Type,
+    'varchar': cqltypes.UTF8Type,
+    'uuid': cqltypes.UUIDType,
+    'timeuuid': cqltypes.TimeUUIDType,
+    'decimal': cqltypes.DecimalType,
+    'float': cqltypes.FloatType,
+    'double': cqltypes.DoubleType,
+    'int': cqltypes.Int32Type,
+    'bigint': cqltypes.LongType,
+    'boolean': cqltypes.BooleanType,
+    'timestamp': cqltypes.DateType,
+    'date': cqltypes.SimpleDateType,
+}
+
+CREATE_KEYSPACE = re.compile(r"CREATE KEYSPACE (IF NOT EXISTS )?(\w+)", re.I)
+CREATE_TABLE = re.compile(r"CREATE TABLE (IF NOT EXISTS )?(?:(\w+)\.)?(\w+) \((.*?)\)(?: WITH CLUSTERING ORDER BY \((.*)\))?$", re.I)
+PRIMARY_KEY = re.compile(r"PRIMARY KEY \((?:\(([^)]*)\)|(\w+))(?:, (.*))?\)$", re.I)
+TRUNCATE = re.compile(r"TRUNCATE (?:TABLE )?(?:(\w+)\.)?(\w+)$", re.I)
+SELECT = re.compile(r"SELECT (.+?) FROM (?:(\w+)\.)?(\w+)(?: WHERE (.+))?$", re.I)
+INSERT = re.compile(r"INSERT INTO (?:(\w+)\.)?(\w+) \(([^)]*)\) VALUES \(([^)]*)\)(?: USING TIMESTAMP (\?|:\w+))?$", re.I)
+UPDATE = re.compile(r"UPDATE (?:(\w+)\.)?(\w+)(?: USING TIMESTAMP (\?|:\w+))? SET (.+?) WHERE (.+)$", re.I)
+DELETE = re.compile(r"DELETE FROM (?:(\w+)\.)?(\w+)(?: USING TIMESTAMP (\?|:\w+))? WHERE (.+)$", re.I)
+CONDITION = re.compile(r"(?:token\(([\w, ]+)\)|(\w+)) (>=|<=|=|>|<) (\?|:\w+)$", re.I)
+TO_DATE = re.compile(r"toDate\((\w+)\)(?: as (\w+))?$", re.I)
+AND = re.compile(r" AND ", re.I)
+
+def _normalize(query):
+    # Single spaces, none inside parentheses, one after each comma
+    query = " ".join(query.split())
+    return re.sub(r"\s*,\s*", ", ", re.sub(r"\s+\)", ")", re.sub(r"\(\s+", "(", query)))
+
+def _marker_name(marker, default):
+    return marker[1:] if marker.startswith(':') else default
+
+def _sort_key(cql_type):
+    return timeuuids.sort_key if cql_type is cqltypes.TimeUUIDType else None
+
+def _routing_key(parts):
+    # Serialized partition key as the partitioner hashes it (composite keys are
+    # length-prefixed and 0-terminated components)
+    if len(parts) == 1:
+        return parts[0]
+    return b"".join(struct.pack('>H', len(part)) + part + b'\x00' for part in parts)
+
+class Keyspace:
+    def __init__(self, name):
+        self.name = name
+        self.tables = {}
+
+# Column of Table.columns, shaped like the driver's schema metadata (cql_type is the type name)
+TableColumn = collections.namedtuple('TableColumn', ['name', 'cql_type'])
+
+class Table:
+    def __init__(self, keyspace, name, types, partition_key, clustering, descending, static):
+        self.keyspace = keyspace
+        self.name = name
+        self.types = types
+        self.columns = {column: TableColumn(column, cql_type.typename) for column, cql_type in types.items()}
+        self.partition_key = partition_key
+        self.clustering = clustering
+        self.descending = descending
+        self.static = static
+        # Column order of SELECT *: partition key, clustering columns, then the rest by name
+        key = partition_key + clustering
+        self.all_columns = key + sorted(column for column in types if column not in key)
+        self.sort_keys = [_sort_key(types[column]) for column in clustering]
+        self.partitions = {}
+
+    def spec(self, name, cql_type=None):
+        return ColumnMetadata(self.keyspace, self.name, name, cql_type or self.types[name])
+
+    def column(self, name):
+        if name not in self.types:
+            raise InvalidRequest(f"Undefined column name {name} in table {self.keyspace}.{self.name}")
+        return name
+
+    def partition(self, key, routing_parts):
+        partition = self.partitions.get(key)
+        if partition is None:
+            partition = self.partitions[key] = Partition(Murmur3Token.hash_fn(_routing_key(routing_parts)))
+        return partition
+
+class Row:
+    __slots__ = ('marker', 'deleted', 'cells')
+
+    def __init__(self):
+        self.marker = None
+        self.deleted = None
+        self.cells = {}
+
+    def live_cells(self):
+        deleted = self.deleted
+        if deleted is None:
+            return self.cells
+        return {column: cell for column, cell in self.cells.items() if cell[1] > deleted}
+
+    def is_live(self, cells):
+        if self.marker is not None and (self.deleted is None or self.marker > self.deleted):
+            return True
+        return any(value is not None for value, _ in cells.values())
+
+class Partition:
+    __slots__ = ('token', 'static', 'rows', '_sorted')
+
+    def __init__(self, token):
+        self.token = token
+        self.static = {}
+        self.rows = {}
+        self._sorted = None
+
+    def row(self, clustering):
+        row = self.rows.get(clustering)
+        if row is None:
+            row = self.rows[clustering] = Row()
+            self._sorted = None
+        return row
+
+    def sorted_rows(self, table):
+        # Rows in clustering order, kept until the next new row
+        if self._sorted is None:
+            rows = list(self.rows.items())
+            for i in reversed(range(len(table.clustering))):
+                key = table.sort_keys[i] or _identity
+                rows.sort(key=lambda item, i=i, key=key: key(item[0][i]), reverse=table.descending[i])
+            self._sorted = rows
+        return self._sorted
+
+def _write_cell(cells, column, value, timestamp):
+    cell = cells.get(column)
+    if cell is None or timestamp >= cell[1]:
+        cells[column] = (value, timestamp)
+
+class Statement:
+    # A parsed statement: its bind markers (ColumnMetadata) and routing key indexes
+    def __init__(self, table):
+        self.table = table
+        self.markers = []
+        self.routing_key_indexes = None
+        self.result_metadata = []
+
+    def marker(self, marker, name, cql_type):
+        self.markers.append(self.table.spec(_marker_name(marker, name), cql_type))
+        return len(self.markers) - 1
+
+    def key_conditions(self, where):
+        # column -> marker index for '=' conditions; the rest as (column or token columns, op, index)
+        equal, ranges = {}, []
+        for condition in AND.split(where):
+            match = CONDITION.match(condition.strip())
+            if match is None:
+                raise InvalidRequest(f"Unsupported condition: {condition}")
+            token_columns, column, op, marker = match.groups()
+            if token_columns:
+                columns = [self.table.column(name.strip()) for name in token_columns.split(',')]
+                if columns != self.table.partition_key:
+                    raise InvalidRequest("token() needs the full partition key")
+                ranges.append((None, op, self.marker(marker, 'partition key token', cqltypes.LongType)))
+                continue
+            column = self.table.column(column)
+            index = self.marker(marker, column, self.table.types[column])
+            if op == '=':
+                equal[column] = index
+            else:
+                ranges.append((column, op, index))
+        if all(column in equal for column in self.table.partition_key):
+            self.routing_key_indexes = [equal[column] for column in self.table.partition_key]
+        return equal, ranges
+
+    def full_key(self, equal):
+        if set(equal) != set(self.table.partition_key + self.table.clustering):
+            raise InvalidRequest(f"Writes to {self.table.name} need equality on the whole primary key")
+
+class Insert(Statement):
+    def __init__(self, table, columns, markers, timestamp):
+        super().__init__(table)
+        columns = [table.column(column.strip()) for column in columns.split(',')]
+        markers = [marker.strip() for marker in markers.split(',')]
+        if len(columns) != len(markers):
+            raise InvalidRequest("Unmatched column names/values")
+        self.columns = [(column, self.marker(marker, column, table.types[column]))
+                        for column, marker in zip(columns, markers)]
+        index = dict(self.columns)
+        if any(column not in index for column in table.partition_key + table.clustering):
+            raise InvalidRequest(f"Inserts into {table.name} need the whole primary key")
+        self.routing_key_indexes = [index[column] for column in table.partition_key]
+        self.timestamp = timestamp and self.marker(timestamp, '[timestamp]', cqltypes.LongType)
+
+    def apply(self, raw, values, timestamp):
+        table = self.table
+        if self.timestamp is not None:
+            timestamp = values[self.timestamp]
+        columns = dict((column, values[index]) for column, index in self.columns)
+        partition = table.partition(tuple(columns[column] for column in table.partition_key),
+                                    [raw[index] for index in self.routing_key_indexes])
+        row = partition.row(tuple(columns[column] for column in table.clustering))
+        row.marker = timestamp if row.marker is None else max(row.marker, timestamp)
+        key = table.partition_key + table.clustering
+        for column, index in self.columns:
+            if column in key or raw[index] is UNSET_VALUE:
+                continue
+            _write_cell(partition.static if column in table.static else row.cells, column, values[index], timestamp)
+
+class Update(Statement):
+    def __init__(self, table, timestamp, assignments, where):
+        super().__init__(table)
+        self.timestamp = timestamp and self.marker(timestamp, '[timestamp]', cqltypes.LongType)
+        self.assignments = []
+        for assignment in assignments.split(','):
+            column, _, marker = assignment.strip().partition(' = ')
+            column = table.column(column.strip())
+            self.assignments.append((column, self.marker(marker.strip(), column, table.types[column])))
+        self.equal, _ = self.key_conditions(where)
+        self.full_key(self.equal)
+
+    def apply(self, raw, values, timestamp):
+        table = self.table
+        if self.timestamp is not None:
+            timestamp = values[self.timestamp]
+        partition = table.partition(tuple(values[self.equal[column]] for column in table.partition_key),
+                                    [raw[index] for index in self.routing_key_indexes])
+        row = partition.row(tuple(values[self.equal[column]] for column in table.clustering))
+        for column, index in self.assignments:
+            if raw[index] is not UNSET_VALUE:
+                _write_cell(partition.static if column in table.static else row.cells, column, values[index], timestamp)
+
+class Delete(Statement):
+    def __init__(self, table, timestamp, where):
+        super().__init__(table)
+        self.timestamp = timestamp and self.marker(timestamp, '[timestamp]', cqltypes.LongType)
+        self.equal, _ = self.key_conditions(where)
+        self.full_key(self.equal)
+
+    def apply(self, raw, values, timestamp):
+        table = self.table
+        if self.timestamp is not None:
+            timestamp = values[self.timestamp]
+        partition = table.partition(tuple(values[self.equal[column]] for column in table.partition_key),
+                                    [raw[index] for index in self.routing_key_indexes])
+        row = partition.row(tuple(values[self.equal[column]] for column in table.clustering))
+        row.deleted = timestamp if row.deleted is None else max(row.deleted, timestamp)
+
+def _identity(value):
+    return value
+
+# Range operators on comparable keys
+OPERATORS = {
+    '>': lambda value, bound: value > bound,
+    '>=': lambda value, bound: value >= bound,
+    '<': lambda value, bound: value < bound,
+    '<=': lambda value, bound: value <= bound,
+}
+
+class Select(Statement):
+    def __init__(self, table, selection, where):
+        super().__init__(table)
+        self.selection = []
+        for item in selection.split(',') if selection.strip() != '*' else table.all_columns:
+            item = item.strip()
+            match = TO_DATE.match(item)
+            if match:
+                column = table.column(match.group(1))
+                name = match.group(2) or f"system.todate({column})"
+                self.selection.append((column, True))
+                self.result_metadata.append(table.spec(name, cqltypes.SimpleDateType))
+            else:
+                column = table.column(item)
+                self.selection.append((column, False))
+                self.result_metadata.append(table.spec(column))
+        self.equal, self.ranges = self.key_conditions(where) if where else ({}, [])
+        for column in self.equal:
+            if column not in table.partition_key and column not in table.clustering:
+                raise InvalidRequest(f"Filtering on {column} needs ALLOW FILTERING, which is not supported")
+        for column, _, _ in self.ranges:
+            if column is not None and column not in table.clustering:
+                raise InvalidRequest(f"Range on {column} is only supported on clustering columns")
+
+    def partitions(self, values):
+        # (partition key, partition) pairs the query reads: the one it names, or a scan
+        # in token order like a range read over the ring
+        table = self.table
+        if self.routing_key_indexes is not None:
+            key = tuple(values[self.equal[column]] for column in table.partition_key)
+            partition = table.partitions.get(key)
+            return [] if partition is None else [(key, partition)]
+        tokens = [(OPERATORS[op], values[index]) for column, op, index in self.ranges if column is None]
+        return sorted(((key, partition) for key, partition in table.partitions.items()
+                       if all(compare(partition.token, bound) for compare, bound in tokens)),
+                      key=lambda item: item[1].token)
+
+    def rows(self, values):
+        table = self.table
+        # (clustering position, comparison, bound key, key function) per clustering restriction
+        filters = []
+        for position, column in enumerate(table.clustering):
+            if column in self.equal:
+                key = table.sort_keys[position] or _identity
+                bound = key(values[self.equal[column]])
+                filters.append((position, OPERATORS['>='], bound, key))
+                filters.append((position, OPERATORS['<='], bound, key))
+        for column, op, index in self.ranges:
+            if column is not None:
+                position = table.clustering.index(column)
+                key = table.sort_keys[position] or _identity
+                filters.append((position, OPERATORS[op], key(values[index]), key))
+
+        partition_positions = {column: i for i, column in enumerate(table.partition_key)}
+        clustering_positions = {column: i for i, column in enumerate(table.clustering)}
+        result = []
+        for partition_key, partition in self.partitions(values):
+            for clustering, row in partition.sorted_rows(table):
+                if not all(compare(key(clustering[position]), bound) for position, compare, bound, key in filters):
+                    continue
+                cells = row.live_cells()
+                if not row.is_live(cells):
+                    continue
+                out = []
+                for column, to_date in self.selection:
+                    if column in partition_positions:
+                        value = partition_key[partition_positions[column]]
+                    elif column in clustering_positions:
+                        value = clustering[clustering_positions[column]]
+                    else:
+                        cell = (partition.static if column in table.static else cells).get(column)
+                        value = None if cell is None else cell[0]
+                    if to_date and value is not None:
+                        value = Date(timeuuids.to_datetime(value).date())
+                    out.append(value)
+                result.append(tuple(out))
+        return result
+
+def _split_columns(body):
+    # Top-level comma separated parts of a CREATE TABLE body
+    parts, depth, current = [], 0, []
+    for char in body:
+        if char == ',' and depth == 0:
+            parts.append("".join(current).strip())
+            current = []
+            continue
+        depth += char == '('
+        depth -= char == ')'
+        current.append(char)
+    parts.append("".join(current).strip())
+    return [part for part in parts if part]
+
+def parse_table(keyspace, query):
+    match = CREATE_TABLE.match(query)
+    _, _, name, body, order = match.groups()
+    columns, static, primary_key = {}, set(), None
+    for part in _split_columns(body):
+        if part.upper().startswith("PRIMARY KEY"):
+            primary_key = PRIMARY_KEY.match(part)
+            continue
+        words = part.split()
+        if words[1].lower() not in CQL_TYPES:
+            raise InvalidRequest(f"Unsupported type {words[1]} for column {words[0]}")
+        columns[words[0]] = CQL_TYPES[words[1].lower()]
+        if len(words) > 2 and words[2].upper() == 'STATIC':
+            static.add(words[0])
+    if primary_key is None:
+        raise InvalidRequest(f"No PRIMARY KEY in table {name}")
+    composite, single, rest = primary_key.groups()
+    partition_key = [column.strip() for column in (composite or single).split(',')]
+    clustering = [column.strip() for column in rest.split(',')] if rest else []
+    directions = {}
+    for item in order.split(',') if order else []:
+        column, direction = item.split()
+        directions[column] = direction.upper() == 'DESC'
+    return Table(keyspace, name, columns, partition_key, clustering,
+                 [directions.get(column, False) for column in clustering], static)
+
+class ResultSet:
+    # Driver ResultSet look-alike over the full result of a query: current_rows is
+    # one page (fetch_size rows), iterating goes through every remaining page
+    def __init__(self, session, rows, columns, fetch_size, offset, row_factory, delay=True):
+        self.session = session
+        self._rows = rows
+        self.column_names = columns
+        self._fetch_size = fetch_size
+        self._row_factory = row_factory
+        self._delay = delay
+        self._page(offset)
+
+    def _page(self, offset):
+        end = len(self._rows) if not self._fetch_size else min(len(self._rows), offset + self._fetch_size)
+        self.current_rows = self._row_factory(self.column_names, self._rows[offset:end])
+        self._next = end
+        self.paging_state = str(end).encode() if end < len(self._rows) else None
+
+    @property
+    def has_more_pages(self):
+        return self.paging_state is not None
+
+    def fetch_next_page(self):
+        if self._delay:
+            self.session.cluster.wait()
+        self._page(self._next)
+
+    def __iter__(self):
+        while True:
+            yield from self.current_rows
+            if not self.has_more_pages:
+                return
+            self.fetch_next_page()
+
+    def all(self):
+        return list(self)
+
+    def one(self):
+        return self.current_rows[0] if self.current_rows else None
+
+class ResponseFuture:
+    # Driver ResponseFuture look-alike: the result is computed when the request is
+    # sent and delivered (result(), callbacks) once the injected latency has passed
+    def __init__(self, session, result, error):
+        self.session = session
+        self._result = result
+        self._error = error
+        self._callbacks = []
+        self._errbacks = []
+        self._done = threading.Event()
+        self._lock = threading.Lock()
+
+    def _deliver(self):
+        with self._lock:
+            self._done.set()
+            callbacks = list(self._callbacks) if self._error is None else list(self._errbacks)
+        argument = self._result.current_rows if self._error is None else self._error
+        for function, args, kwargs in callbacks:
+            try:
+                function(argument, *args, **kwargs)
+            except Exception:
+                log.exception(f"Unhandled error in response callback {function!r}")
+
+    @property
+    def has_more_pages(self):
+        return self._result is not None and self._result.has_more_pages
+
+    def start_fetching_next_page(self):
+        if not self.has_more_pages:
+            raise RuntimeError("No more pages to fetch")
+        with self._lock:
+            self._done.clear()
+        self._result._page(self._result._next)
+        self.session.cluster.call_later(self._deliver)
+
+    def result(self):
+        self._done.wait()
+        if self._error is not None:
+            raise self._error
+        self._result._delay = True
+        return self._result
+
+    def add_callback(self, fn, *args, **kwargs):
+        self.add_callbacks(fn, None, callback_args=args, callback_kwargs=kwargs)
+
+    def add_errback(self, fn, *args, **kwargs):
+        self.add_callbacks(None, fn, errback_args=args, errback_kwargs=kwargs)
+
+    def add_callbacks(self, callback, errback, callback_args=(), callback_kwargs=None,
+                      errback_args=(), errback_kwargs=None):
+        with self._lock:
+            if callback is not None:
+                self._callbacks.append((callback, callback_args, callback_kwargs or {}))
+            if errback is not None:
+                self._errbacks.append((errback, errback_args, errback_kwargs or {}))
+            done = self._done.is_set()
+        if not done:
+            return
+        # Already delivered: run now, in the calling thread, like the driver
+        if self._error is None:
+            if callback is not None:
+                callback(self._result.current_rows, *callback_args, **(callback_kwargs or {}))
+        elif errback is not None:
+            errback(self._error, *errback_args, **(errback_kwargs or {}))
+
+class _ProfileManager:
+    def __init__(self, profiles):
+        self.profiles = profiles
+
+class Metadata:
+    def __init__(self, keyspaces):
+        self.keyspaces = keyspaces
+
+    def get_replicas(self, keyspace, key):
+        # A single node owns every token
+        return [HOST]
+
+class Session:
+    def __init__(self, cluster, keyspace=None):
+        self.cluster = cluster
+        self.keyspace = None
+        self.default_fetch_size = DEFAULT_FETCH_SIZE
+        self.row_factory = named_tuple_factory
+        self.is_shutdown = False
+        self._prepared = {}
+        if keyspace:
+            self.set_keyspace(keyspace)
+
+    def set_keyspace(self, keyspace):
+        if keyspace not in self.cluster.metadata.keyspaces:
+            raise InvalidRequest(f"Keyspace '{keyspace}' does not exist")
+        self.keyspace = keyspace
+
+    def _table(self, keyspace, name):
+        keyspace = keyspace or self.keyspace
+        if keyspace is None:
+            raise InvalidRequest("No keyspace has been specified")
+        tables = self.cluster.metadata.keyspaces.get(keyspace)
+        if tables is None or name not in tables.tables:
+            raise InvalidRequest(f"unconfigured table {name}")
+        return tables.tables[name]
+
+    def _parse(self, query):
+        match = SELECT.match(query)
+        if match:
+            selection, keyspace, name, where = match.groups()
+            return Select(self._table(keyspace, name), selection, where)
+        match = INSERT.match(query)
+        if match:
+            keyspace, name, columns, markers, timestamp = match.groups()
+            return Insert(self._table(keyspace, name), columns, markers, timestamp)
+        match = UPDATE.match(query)
+        if match:
+            keyspace, name, timestamp, assignments, where = match.groups()
+            return Update(self._table(keyspace, name), timestamp, assignments, where)
+        match = DELETE.match(query)
+        if match:
+            keyspace, name, timestamp, where = match.groups()
+            return Delete(self._table(keyspace, name), timestamp, where)
+        raise InvalidRequest(f"Statement not supported by the memory backend: {query}")
+
+    def prepare(self, query):
+        statement = self._parse(_normalize(query))
+        query_id = self.cluster.register(statement)
+        prepared = PreparedStatement(statement.markers, query_id, statement.routing_key_indexes, query,
+                                     statement.table.keyspace, PROTOCOL_VERSION, statement.result_metadata, None)
+        return prepared
+
+    def _schema(self, query):
+        # DDL and other statements run as plain strings; None when query is not one
+        match = CREATE_KEYSPACE.match(query)
+        if match:
+            if_not_exists, name = match.groups()
+            with self.cluster.lock:
+                if name in self.cluster.metadata.keyspaces:
+                    if not if_not_exists:
+                        raise InvalidRequest(f"Keyspace {name} already exists")
+                else:
+                    self.cluster.metadata.keyspaces[name] = Keyspace(name)
+            return True
+        match = CREATE_TABLE.match(query)
+        if match:
+            if_not_exists, keyspace, name = match.groups()[:3]
+            keyspace = keyspace or self.keyspace
+            if keyspace not in self.cluster.metadata.keyspaces:
+                raise InvalidRequest(f"Keyspace '{keyspace}' does not exist")
+            tables = self.cluster.metadata.keyspaces[keyspace].tables
+            with self.cluster.lock:
+                if name in tables:
+                    if not if_not_exists:
+                        raise InvalidRequest(f"Table {keyspace}.{name} already exists")
+                else:
+                    tables[name] = parse_table(keyspace, query)
+            return True
+        match = TRUNCATE.match(query)
+        if match:
+            table = self._table(*match.groups())
+            with self.cluster.lock:
+                table.partitions = {}
+            return True
+        return None
+
+    def _run(self, statement, parameters, paging_state, execution_profile):
+        # Runs one request against the store: its ResultSet, or the error it raises
+        if isinstance(statement, str):
+            query = _normalize(statement)
+            if parameters is None and self._schema(query):
+                return ResultSet(self, [], [], None, 0, named_tuple_factory)
+            statement = self.prepare(statement)
+        if isinstance(statement, PreparedStatement):
+            statement = statement.bind(parameters or ())
+        profile = self.cluster.profile_manager.profiles.get(execution_profile)
+        row_factory = getattr(profile, 'row_factory', None) or self.row_factory
+        timestamp = self.cluster.timestamp()
+
+        if isinstance(statement, BatchStatement):
+            with self.cluster.lock:
+                for is_prepared, query_id, values in statement._statements_and_parameters:
+                    if not is_prepared:
+                        raise InvalidRequest("The memory backend only batches prepared statements")
+                    self._apply(self.cluster.statement(query_id), values, timestamp)
+            return ResultSet(self, [], [], None, 0, row_factory)
+        if not isinstance(statement, BoundStatement):
+            raise InvalidRequest(f"Statement type not supported by the memory backend: {type(statement).__name__}")
+
+        parsed = self.cluster.statement(statement.prepared_statement.query_id)
+        if not isinstance(parsed, Select):
+            with self.cluster.lock:
+                self._apply(parsed, statement.values, timestamp)
+            return ResultSet(self, [], [], None, 0, row_factory)
+        with self.cluster.lock:
+            rows = parsed.rows(self._decode(parsed, statement.values))
+        fetch_size = statement.fetch_size
+        if fetch_size is FETCH_SIZE_UNSET:
+            fetch_size = self.default_fetch_size
+        offset = int(paging_state) if paging_state else 0
+        return ResultSet(self, rows, [column.name for column in parsed.result_metadata], fetch_size, offset,
+                         row_factory, delay=False)
+
+    def _decode(self, parsed, raw):
+        if len(raw) != len(parsed.markers):
+            raise InvalidRequest(f"Expected {len(parsed.markers)} values, got {len(raw)}")
+        return [None if value is None or value is UNSET_VALUE else spec.type.from_binary(value, PROTOCOL_VERSION)
+                for spec, value in zip(parsed.markers, raw)]
+
+    def _apply(self, parsed, raw, timestamp):
+        if isinstance(parsed, Select):
+            raise InvalidRequest("Only writes may be batched")
+        parsed.apply(raw, self._decode(parsed, raw), timestamp)
+
+    def execute(self, query, parameters=None, timeout=None, trace=False, custom_payload=None,
+                execution_profile=EXEC_PROFILE_DEFAULT, paging_state=None, host=None, execute_as=None):
+        result = self._run(query, parameters, paging_state, execution_profile)
+        self.cluster.wait()
+        result._delay = True
+        return result
+
+    def execute_async(self, query, parameters=None, trace=False, custom_payload=None, timeout=None,
+                      execution_profile=EXEC_PROFILE_DEFAULT, paging_state=None, host=None, execute_as=None):
+        try:
+            future = ResponseFuture(self, self._run(query, parameters, paging_state, execution_profile), None)
+        except Exception as exc:
+            future = ResponseFuture(self, None, exc)
+        self.cluster.call_later(future._deliver)
+        return future
+
+    def shutdown(self):
+        self.is_shutdown = True
+
+class Cluster:
+    # Stands in for cassandra.cluster.Cluster: one in-memory store shared by the
+    # sessions it connects, and the thread that delivers asynchronous responses
+    def __init__(self, latency=0.0, jitter=0.0, execution_profiles=None, **_ignored):
+        self.latency = latency
+        self.jitter = jitter
+        self.metadata = Metadata({})
+        self.profile_manager = _ProfileManager(dict(execution_profiles or {}))
+        self.metrics = None
+        self.lock = threading.RLock()
+        self._statements = {}
+        self._last_timestamp = 0
+        self._queue = []
+        self._sequence = itertools.count()
+        self._wakeup = threading.Condition()
+        self._thread = None
+        self.is_shutdown = False
+
+    def connect(self, keyspace=None):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._deliver, name='memstore-responses', daemon=True)
+            self._thread.start()
+        return Session(self, keyspace)
+
+    def register(self, statement):
+        with self.lock:
+            query_id = str(len(self._statements)).encode()
+            self._statements[query_id] = statement
+        return query_id
+
+    def statement(self, query_id):
+        return self._statements[query_id]
+
+    def timestamp(self):
+        # Client write timestamps in microseconds, strictly increasing like the driver's
+        with self.lock:
+            self._last_timestamp = max(time.time_ns() // 1000, self._last_timestamp + 1)
+            return self._last_timestamp
+
+    def delay(self):
+        return self.latency + (random.uniform(0, self.jitter) if self.jitter else 0.0)
+
+    def wait(self):
+        delay = self.delay()
+        if delay > 0:
+            time.sleep(delay)
+
+    def call_later(self, function):
+        with self._wakeup:
+            heapq.heappush(self._queue, (time.monotonic() + self.delay(), next(self._sequence), function))
+            self._wakeup.notify()
+
+    def _deliver(self):
+        while True:
+            with self._wakeup:
+                while not self._queue:
+                    if self.is_shutdown:
+                        return
+                    self._wakeup.wait()
+                due, _, function = self._queue[0]
+                remaining = due - time.monotonic()
+                if remaining > 0:
+                    self._wakeup.wait(remaining)
+                    continue
+                heapq.heappop(self._queue)
+            function()
+
+    def shutdown(self):
+        with self._wakeup:
+            self.is_shutdown = True
+            self._wakeup.notify()
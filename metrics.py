@@ -0,0 +1,202 @@
+#!/usr/bin/env python3
+import bisect
+import logging
+import threading
+
+from cassandra import OperationTimedOut, Timeout
+
+# Set logger
+log = logging.getLogger()
+
+# Latency histogram buckets in seconds (upper bounds, +Inf implied)
+BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+DUMP_INTERVAL = 15.0
+
+# Query label for a statement name: the access pattern it serves (Q1 ... Q3.5),
+# or the statement name itself for inserts
+SHIPMENT_LABELS = {
+    'shipments_by_o_ssd': 'Q3.3',
+    'shipments_by_o_tsd': 'Q3.4',
+    'shipments_by_o_tssd': 'Q3.5',
+}
+
+def statement_label(name):
+    if name.startswith('orders_by_customer'):
+        return 'Q1'
+    if name == 'products_by_order':
+        return 'Q2'
+    for table, label in SHIPMENT_LABELS.items():
+        if name == table or name.startswith(table + '_'):
+            return label
+    if name.startswith('shipments_by_o_sd'):
+        return 'Q3.1' if name == 'shipments_by_o_sd' else 'Q3.2'
+    return name
+
+class Histogram:
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def cumulative(self):
+        total = 0
+        for bound, count in zip(self.buckets + (float('inf'),), self.counts):
+            total += count
+            yield bound, total
+
+class QueryMetrics:
+    def __init__(self):
+        self.latency = Histogram()
+        self.rows = 0
+        self.errors = 0
+        self.timeouts = 0
+        self.retries = 0
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self.mutations = 0
+        self.tombstones = 0
+
+# Counter name, help text and QueryMetrics attribute for the Prometheus export
+COUNTERS = [
+    ('logistics_query_rows_total', "Rows returned or written", 'rows'),
+    ('logistics_query_errors_total', "Failed requests", 'errors'),
+    ('logistics_query_timeouts_total', "Requests that timed out", 'timeouts'),
+    ('logistics_query_retries_total', "Retried requests", 'retries'),
+    ('logistics_query_cache_hits_total', "Query cache hits", 'cache_hits'),
+    ('logistics_query_cache_misses_total', "Query cache misses", 'cache_misses'),
+    ('logistics_write_mutations_total', "Rows written by logical writes (divide by rows for write amplification)",
+     'mutations'),
+    ('logistics_write_tombstones_total', "Tombstones created by logical writes", 'tombstones'),
+]
+
+class Metrics:
+    # Per-query instrumentation keyed by query label, exported in Prometheus text format
+    def __init__(self):
+        self.cluster = None
+        self._queries = {}
+        self._lock = threading.Lock()
+
+    def _get(self, label):
+        query = self._queries.get(label)
+        if query is None:
+            query = self._queries.setdefault(label, QueryMetrics())
+        return query
+
+    def observe(self, label, seconds, rows=0):
+        with self._lock:
+            query = self._get(label)
+            query.latency.observe(seconds)
+            query.rows += rows
+
+    def write(self, label, seconds, mutations, tombstones=0):
+        # One logical write that was fanned out to mutations row writes
+        with self._lock:
+            query = self._get(label)
+            query.latency.observe(seconds)
+            query.rows += 1
+            query.mutations += mutations
+            query.tombstones += tombstones
+
+    def error(self, label, exc):
+        with self._lock:
+            query = self._get(label)
+            query.errors += 1
+            if isinstance(exc, (Timeout, OperationTimedOut)):
+                query.timeouts += 1
+
+    def retry(self, label):
+        with self._lock:
+            self._get(label).retries += 1
+
+    def cache_hit(self, label):
+        with self._lock:
+            self._get(label).cache_hits += 1
+
+    def cache_miss(self, label):
+        with self._lock:
+            self._get(label).cache_misses += 1
+
+    def attach_cluster(self, cluster):
+        # Also export the driver's Cluster.metrics (needs metrics_enabled=True)
+        self.cluster = cluster
+
+    def reset(self):
+        with self._lock:
+            self._queries.clear()
+
+    def render(self):
+        lines = []
+        with self._lock:
+            queries = sorted(self._queries.items())
+            lines.append("# HELP logistics_query_latency_seconds Client-side latency per query")
+            lines.append("# TYPE logistics_query_latency_seconds histogram")
+            for label, query in queries:
+                for bound, count in query.latency.cumulative():
+                    le = '+Inf' if bound == float('inf') else repr(bound)
+                    lines.append(f'logistics_query_latency_seconds_bucket{{query="{label}",le="{le}"}} {count}')
+                lines.append(f'logistics_query_latency_seconds_sum{{query="{label}"}} {query.latency.sum}')
+                lines.append(f'logistics_query_latency_seconds_count{{query="{label}"}} {query.latency.count}')
+            for metric, help_text, attribute in COUNTERS:
+                lines.append(f"# HELP {metric} {help_text}")
+                lines.append(f"# TYPE {metric} counter")
+                for label, query in queries:
+                    lines.append(f'{metric}{{query="{label}"}} {getattr(query, attribute)}')
+        lines.extend(self._render_driver())
+        return "\n".join(lines) + "\n"
+
+    def _render_driver(self):
+        if self.cluster is None or self.cluster.metrics is None:
+            return []
+        lines = []
+        for name, value in sorted(self.cluster.metrics.get_stats().items()):
+            if isinstance(value, dict):
+                for stat, stat_value in sorted(value.items()):
+                    if isinstance(stat_value, (int, float)):
+                        lines.append(f'cassandra_driver_{name}{{stat="{stat}"}} {stat_value}')
+            elif isinstance(value, (int, float)):
+                lines.append(f"cassandra_driver_{name} {value}")
+        return lines
+
+REGISTRY = Metrics()
+
+def start_http_server(port, address=''):
+    # Imported here: only needed when metrics are served
+    import http.server
+
+    class Handler(http.server.BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path != '/metrics':
+                self.send_error(404)
+                return
+            body = REGISTRY.render().encode()
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/plain; version=0.0.4')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = http.server.ThreadingHTTPServer((address, port), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    log.info(f"Serving metrics on port {port}")
+    return server
+
+def start_dump(path, interval=DUMP_INTERVAL):
+    # Rewrites path with the current metrics every interval seconds
+    stop = threading.Event()
+
+    def dump():
+        while not stop.wait(interval):
+            with open(path, 'w') as f:
+                f.write(REGISTRY.render())
+
+    threading.Thread(target=dump, daemon=True).start()
+    return stop
@@ -1,11 +1,22 @@
 #!/usr/bin/env python3
+import collections
 import datetime
+import itertools
 import logging
 import random
+import threading
+import time
 import uuid
+import weakref
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, as_completed, wait
 
-import time_uuid
-from cassandra.query import BatchStatement
+from cassandra.protocol import PreparedQueryNotFound
+from cassandra.query import BatchStatement, BatchType
+
+import cache
+import loader
+import metrics
+import timeuuids
 
 # Set logger
 log = logging.getLogger()
@@ -28,6 +39,23 @@ CREATE_ORDERS_BY_CUSTOMERS_TABLE = """
     ) WITH CLUSTERING ORDER BY (order_date DESC)
 """
 
+# Customer dashboard: one row per order with its aggregates, in the same
+# partition layout as orders_by_customers. Written with the base tables.
+CREATE_ORDER_SUMMARIES_BY_CUSTOMER_TABLE = """
+    CREATE TABLE IF NOT EXISTS order_summaries_by_customer (
+        email              TEXT,
+        order_date         TIMEUUID,
+        name               TEXT STATIC,
+        order_number       TEXT,
+        total_amount       DECIMAL,
+        status             TEXT,
+        item_count         INT,
+        shipment_count     INT,
+        latest_ship_status TEXT,
+        PRIMARY KEY ((email), order_date)
+    ) WITH CLUSTERING ORDER BY (order_date DESC)
+"""
+
 # Q2: products_by_order
 CREATE_PRODUCTS_BY_ORDER_TABLE = """
     CREATE TABLE IF NOT EXISTS products_by_order (
@@ -96,6 +124,26 @@ CREATE_SHIPMENTS_BY_O_TSSD_TABLE = """
     ) WITH CLUSTERING ORDER BY (ship_type ASC, ship_status ASC, shipment_date DESC)
 """
 
+# CREATE TABLE statement of every table, in creation order
+TABLE_SCHEMAS = {
+    'orders_by_customers': CREATE_ORDERS_BY_CUSTOMERS_TABLE,
+    'order_summaries_by_customer': CREATE_ORDER_SUMMARIES_BY_CUSTOMER_TABLE,
+    'products_by_order': CREATE_PRODUCTS_BY_ORDER_TABLE,
+    'shipments_by_o_sd': CREATE_SHIPMENTS_BY_O_SD_TABLE,
+    'shipments_by_o_ssd': CREATE_SHIPMENTS_BY_O_SSD_TABLE,
+    'shipments_by_o_tsd': CREATE_SHIPMENTS_BY_O_TSD_TABLE,
+    'shipments_by_o_tssd': CREATE_SHIPMENTS_BY_O_TSSD_TABLE,
+}
+
+# Money columns. DECIMAL by default; with money_cents (migrate, create_schema) they
+# are BIGINT integer cents, which bind and decode without decimal.Decimal and
+# keep generated amounts exact. Readers get the integers as stored.
+MONEY_COLUMNS = ('total_amount', 'price', 'ship_amount')
+MONEY_TYPES = {False: 'decimal', True: 'bigint'}
+
+def to_cents(amount):
+    return int(round(amount * 100))
+
 # Query statements 
 # Q1
 SELECT_ORDERS_BY_CUSTOMER = """
@@ -104,6 +152,21 @@ SELECT_ORDERS_BY_CUSTOMER = """
     WHERE email = ?
 """
 
+# Q1 with per-order aggregates
+SELECT_ORDER_SUMMARIES_BY_CUSTOMER = """
+    SELECT email, toDate(order_date) as order_date_readable, name, order_number, total_amount, status,
+           item_count, shipment_count, latest_ship_status
+    FROM order_summaries_by_customer
+    WHERE email = ?
+"""
+
+# Base rows of a customer's orders (order_date as stored), for the summary checker
+SELECT_ORDER_KEYS_BY_CUSTOMER = """
+    SELECT email, order_date, name, order_number, total_amount, status
+    FROM orders_by_customers
+    WHERE email = ?
+"""
+
 # Q2
 SELECT_PRODUCTS_BY_ORDER = """
     SELECT order_number, product_name, price, category, quantity
@@ -111,80 +174,230 @@ SELECT_PRODUCTS_BY_ORDER = """
     WHERE order_number = ?
 """
 
-# Q3.1: All shipments (no date filter)
-SELECT_SHIPMENTS_BY_ORDER = """
+# Q3.1 - Q3.5: shipments of an order, from the table whose clustering columns
+# (in front of shipment_date) match the equality filters. Any query may add a
+# shipment_date range; Q3.1 is shipments_by_o_sd without one and Q3.2 with one.
+SHIPMENT_TABLES = {
+    'shipments_by_o_sd': [],
+    'shipments_by_o_ssd': ['ship_status'],
+    'shipments_by_o_tsd': ['ship_type'],
+    'shipments_by_o_tssd': ['ship_type', 'ship_status'],
+}
+
+# Statement name suffix per (start bound, end bound) of a date range
+DATE_RANGES = {
+    (False, False): '',
+    (True, False): '_from',
+    (False, True): '_to',
+    (True, True): '_date_range',
+}
+
+# Q1 limited to orders placed from and/or until a date
+def orders_select(start_bound=False, end_bound=False):
+    where = [SELECT_ORDERS_BY_CUSTOMER.rstrip()]
+    if start_bound:
+        where.append("order_date >= ?")
+    if end_bound:
+        where.append("order_date <= ?")
+    return "\n    AND ".join(where) + "\n"
+
+def shipment_select(table, start_bound=False, end_bound=False):
+    where = ["order_number = ?"] + [f"{column} = ?" for column in SHIPMENT_TABLES[table]]
+    if start_bound:
+        where.append("shipment_date >= ?")
+    if end_bound:
+        where.append("shipment_date <= ?")
+    conditions = "\n    AND ".join(where)
+    return f"""
     SELECT order_number, toDate(shipment_date) as ship_date_readable,
            tracking_number, ship_status, ship_type, ship_amount, customer_name
-    FROM shipments_by_o_sd
-    WHERE order_number = ?
+    FROM {table}
+    WHERE {conditions}
 """
 
-# Q3.2: Same as Q3.1 (with date range)
-SELECT_SHIPMENTS_BY_ORDER_DATE_RANGE = """
-    SELECT order_number, toDate(shipment_date) as ship_date_readable,
-           tracking_number, ship_status, ship_type, ship_amount, customer_name
+# One shipment by its key, for writes that need the current row
+SELECT_SHIPMENT_BY_DATE = """
+    SELECT order_number, shipment_date, tracking_number, ship_status, ship_type, ship_amount, customer_name
     FROM shipments_by_o_sd
-    WHERE order_number = ?
-    AND shipment_date >= minTimeuuid(?)
-    AND shipment_date <= maxTimeuuid(?)
+    WHERE order_number = ? AND shipment_date = ?
 """
 
-# Q3.3: Shipments by status with date range
-SELECT_SHIPMENTS_BY_ORDER_STATUS = """
-    SELECT order_number, toDate(shipment_date) as ship_date_readable,
-           tracking_number, ship_status, ship_type, ship_amount, customer_name
-    FROM shipments_by_o_ssd
-    WHERE order_number = ?
-    AND ship_status = ?
-    AND shipment_date >= minTimeuuid(?)
-    AND shipment_date <= maxTimeuuid(?)
-"""
-SELECT_SHIPMENTS_BY_ORDER_STATUS_NO_DATE = """
-    SELECT order_number, toDate(shipment_date) as ship_date_readable,
-           tracking_number, ship_status, ship_type, ship_amount, customer_name
-    FROM shipments_by_o_ssd
-    WHERE order_number = ?
-    AND ship_status = ?
-"""
+# Insert statements
+INSERT_ORDERS_BY_CUSTOMERS = "INSERT INTO orders_by_customers (email, order_date, name, order_number, total_amount, status) VALUES (?, ?, ?, ?, ?, ?)"
+INSERT_ORDER_SUMMARIES_BY_CUSTOMER = "INSERT INTO order_summaries_by_customer (email, order_date, name, order_number, total_amount, status, item_count, shipment_count, latest_ship_status) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)"
+INSERT_PRODUCTS_BY_ORDER = "INSERT INTO products_by_order (order_number, product_name, price, category, quantity) VALUES (?, ?, ?, ?, ?)"
+INSERT_SHIPMENTS_BY_O_SD = "INSERT INTO shipments_by_o_sd (order_number, shipment_date, tracking_number, ship_status, ship_type, ship_amount, customer_name) VALUES (?, ?, ?, ?, ?, ?, ?)"
+INSERT_SHIPMENTS_BY_O_SSD = "INSERT INTO shipments_by_o_ssd (order_number, ship_status, shipment_date, tracking_number, ship_type, ship_amount, customer_name) VALUES (?, ?, ?, ?, ?, ?, ?)"
+INSERT_SHIPMENTS_BY_O_TSD = "INSERT INTO shipments_by_o_tsd (order_number, ship_type, shipment_date, tracking_number, ship_status, ship_amount, customer_name) VALUES (?, ?, ?, ?, ?, ?, ?)"
+INSERT_SHIPMENTS_BY_O_TSSD = "INSERT INTO shipments_by_o_tssd (order_number, ship_type, ship_status, shipment_date, tracking_number, ship_amount, customer_name) VALUES (?, ?, ?, ?, ?, ?, ?)"
 
-# Q3.4: Shipments by type with date range
-SELECT_SHIPMENTS_BY_ORDER_TYPE = """
-    SELECT order_number, toDate(shipment_date) as ship_date_readable,
-           tracking_number, ship_status, ship_type, ship_amount, customer_name
-    FROM shipments_by_o_tsd
-    WHERE order_number = ?
-    AND ship_type = ?
-    AND shipment_date >= minTimeuuid(?)
-    AND shipment_date <= maxTimeuuid(?)
-"""
-SELECT_SHIPMENTS_BY_ORDER_TYPE_NO_DATE = """
-    SELECT order_number, toDate(shipment_date) as ship_date_readable,
-           tracking_number, ship_status, ship_type, ship_amount, customer_name
-    FROM shipments_by_o_tsd
-    WHERE order_number = ?
-    AND ship_type = ?
-"""
+# Every statement the app runs, by name. Prepared once per session by StatementRegistry.
+STATEMENTS = {
+    'orders_by_customer': SELECT_ORDERS_BY_CUSTOMER,
+    'order_summaries_by_customer': SELECT_ORDER_SUMMARIES_BY_CUSTOMER,
+    'order_keys_by_customer': SELECT_ORDER_KEYS_BY_CUSTOMER,
+    'products_by_order': SELECT_PRODUCTS_BY_ORDER,
+    'shipment_by_date': SELECT_SHIPMENT_BY_DATE,
+    'insert_orders_by_customers': INSERT_ORDERS_BY_CUSTOMERS,
+    'insert_order_summaries_by_customer': INSERT_ORDER_SUMMARIES_BY_CUSTOMER,
+    'insert_products_by_order': INSERT_PRODUCTS_BY_ORDER,
+    'insert_shipments_by_o_sd': INSERT_SHIPMENTS_BY_O_SD,
+    'insert_shipments_by_o_ssd': INSERT_SHIPMENTS_BY_O_SSD,
+    'insert_shipments_by_o_tsd': INSERT_SHIPMENTS_BY_O_TSD,
+    'insert_shipments_by_o_tssd': INSERT_SHIPMENTS_BY_O_TSSD,
+}
+STATEMENTS.update({
+    table + suffix: shipment_select(table, *bounds)
+    for table in SHIPMENT_TABLES
+    for bounds, suffix in DATE_RANGES.items()
+})
+STATEMENTS.update({'orders_by_customer' + suffix: orders_select(*bounds) for bounds, suffix in DATE_RANGES.items() if suffix})
 
-# Q3.5: Shipments by type and status with date range
-SELECT_SHIPMENTS_BY_ORDER_TYPE_STATUS = """
-    SELECT order_number, toDate(shipment_date) as ship_date_readable,
-           tracking_number, ship_status, ship_type, ship_amount, customer_name
-    FROM shipments_by_o_tssd
+# shipment_date and ship_status of every shipment of an order, for the consistency check
+def shipment_statuses_select(table):
+    return f"""
+    SELECT shipment_date, ship_status
+    FROM {table}
     WHERE order_number = ?
-    AND ship_type = ?
-    AND ship_status = ?
-    AND shipment_date >= minTimeuuid(?)
-    AND shipment_date <= maxTimeuuid(?)
 """
-SELECT_SHIPMENTS_BY_ORDER_TYPE_STATUS_NO_DATE = """
-    SELECT order_number, toDate(shipment_date) as ship_date_readable,
-           tracking_number, ship_status, ship_type, ship_amount, customer_name
-    FROM shipments_by_o_tssd
-    WHERE order_number = ?
-    AND ship_type = ?
-    AND ship_status = ?
+
+STATEMENTS.update({'shipment_statuses_' + table: shipment_statuses_select(table) for table in SHIPMENT_TABLES})
+
+# Optional time-bucketed layout (migrate or create_schema with bucketed=True). Orders and
+# shipments get one partition per key and calendar month, in tables named with
+# BUCKET_SUFFIX whose partition key adds a bucket column (YYYYMM). partition_buckets
+# lists the buckets written for each key, newest first, for queries without a full
+# date range; queries with both bounds go straight to the months they overlap.
+BUCKET_SUFFIX = '_by_month'
+MAX_BUCKET_FANOUT = 16
+
+# Bucketed table: partition key column, timeuuid column that picks the bucket and
+# the name the table's buckets are listed under in partition_buckets
+BUCKETED_TABLES = {'orders_by_customers': ('email', 'order_date', 'orders_by_customers')}
+BUCKETED_TABLES.update((table, ('order_number', 'shipment_date', 'shipments')) for table in SHIPMENT_TABLES)
+
+CREATE_PARTITION_BUCKETS_TABLE = """
+    CREATE TABLE IF NOT EXISTS partition_buckets (
+        table_name    TEXT,
+        partition_key TEXT,
+        bucket        INT,
+        PRIMARY KEY ((table_name, partition_key), bucket)
+    ) WITH CLUSTERING ORDER BY (bucket DESC)
 """
 
+# Statements that have a bucketed variant (name + BUCKET_SUFFIX), by table
+STATEMENT_TABLES = {
+    'orders_by_customer' + suffix: 'orders_by_customers' for suffix in DATE_RANGES.values()
+}
+STATEMENT_TABLES.update({
+    'order_keys_by_customer': 'orders_by_customers',
+    'insert_orders_by_customers': 'orders_by_customers',
+    'shipment_by_date': 'shipments_by_o_sd',
+})
+STATEMENT_TABLES.update({table + suffix: table for table in SHIPMENT_TABLES for suffix in DATE_RANGES.values()})
+STATEMENT_TABLES.update({'insert_' + table: table for table in SHIPMENT_TABLES})
+STATEMENT_TABLES.update({'shipment_statuses_' + table: table for table in SHIPMENT_TABLES})
+
+def bucketed_statement(statement, table):
+    # Same statement against table + BUCKET_SUFFIX, with the bucket bound right
+    # after the partition key (SELECT) or first (INSERT)
+    partition_key = BUCKETED_TABLES[table][0]
+    if statement.startswith("INSERT"):
+        statement = statement.replace(f"INSERT INTO {table} (", f"INSERT INTO {table}{BUCKET_SUFFIX} (bucket, ")
+        return statement.replace("VALUES (", "VALUES (?, ")
+    statement = statement.replace(f"FROM {table}\n", f"FROM {table}{BUCKET_SUFFIX}\n")
+    return statement.replace(f"WHERE {partition_key} = ?", f"WHERE {partition_key} = ? AND bucket = ?")
+
+def bucketed_table(create_table, table):
+    partition_key = BUCKETED_TABLES[table][0]
+    create_table = create_table.replace(f"EXISTS {table} (", f"EXISTS {table}{BUCKET_SUFFIX} (\n        bucket INT,")
+    return create_table.replace(f"PRIMARY KEY (({partition_key}),", f"PRIMARY KEY (({partition_key}, bucket),")
+
+# Statements only used in the bucketed layout
+BUCKET_STATEMENTS = {name + BUCKET_SUFFIX: bucketed_statement(STATEMENTS[name], table)
+                     for name, table in STATEMENT_TABLES.items()}
+BUCKET_STATEMENTS.update({
+    'partition_buckets': "SELECT bucket FROM partition_buckets WHERE table_name = ? AND partition_key = ?",
+    'insert_partition_bucket': "INSERT INTO partition_buckets (table_name, partition_key, bucket) VALUES (?, ?, ?)",
+})
+
+def _insert_columns(name):
+    return STATEMENTS[name].split("(", 1)[1].split(")", 1)[0].split(", ")
+
+# Shipment writes (record_shipment, update_shipment_status). They use named bind
+# markers, so one dict of column values binds the statement of any table in
+# either layout, and a client-side write time (USING TIMESTAMP), so a retried or
+# replayed change never overrides a newer one.
+def shipment_write(kind, table, bucketed=False):
+    target = table + BUCKET_SUFFIX if bucketed else table
+    bucket = ['bucket'] if bucketed else []
+    if kind == 'insert':
+        columns = bucket + _insert_columns('insert_' + table)
+        markers = ', '.join(':' + column for column in columns)
+        return f"INSERT INTO {target} ({', '.join(columns)}) VALUES ({markers}) USING TIMESTAMP :write_time"
+    key = ['order_number'] + bucket + SHIPMENT_TABLES[table] + ['shipment_date']
+    where = " AND ".join(f"{column} = :{column}" for column in key)
+    if kind == 'delete':
+        return f"DELETE FROM {target} USING TIMESTAMP :write_time WHERE {where}"
+    return f"UPDATE {target} USING TIMESTAMP :write_time SET ship_status = :new_status WHERE {where}"
+
+# ship_status is part of the row key in some tables: a status change there moves
+# the row (delete + insert); elsewhere it is an update in place
+SHIPMENT_WRITES = [
+    (f"{kind}_{table}_at", kind, table)
+    for table, columns in SHIPMENT_TABLES.items()
+    for kind in ('insert', 'delete' if 'ship_status' in columns else 'update')
+]
+STATEMENTS.update({name: shipment_write(kind, table) for name, kind, table in SHIPMENT_WRITES})
+STATEMENT_TABLES.update({name: table for name, _, table in SHIPMENT_WRITES})
+BUCKET_STATEMENTS.update({
+    name + BUCKET_SUFFIX: shipment_write(kind, table, bucketed=True) for name, kind, table in SHIPMENT_WRITES
+})
+STATEMENTS.update(BUCKET_STATEMENTS)
+
+# Summary side of shipment writes: one summary row by its key, its latest shipment
+# status and its shipment count
+STATEMENTS['order_summary_by_key'] = (
+    "SELECT order_number, shipment_count FROM order_summaries_by_customer WHERE email = ? AND order_date = ?")
+STATEMENTS['update_order_summary_status'] = (
+    "UPDATE order_summaries_by_customer USING TIMESTAMP :write_time SET latest_ship_status = :new_status "
+    "WHERE email = :email AND order_date = :order_date")
+STATEMENTS['update_order_summary_count'] = (
+    "UPDATE order_summaries_by_customer USING TIMESTAMP :write_time SET shipment_count = :shipment_count "
+    "WHERE email = :email AND order_date = :order_date")
+
+def month_bucket(value):
+    # YYYYMM of a timeuuid, datetime or date
+    if isinstance(value, uuid.UUID):
+        value = timeuuids.to_datetime(value)
+    return value.year * 100 + value.month
+
+def month_buckets(start_date, end_date):
+    # Every month from end_date back to start_date, newest first
+    buckets = []
+    year, month = end_date.year, end_date.month
+    while (year, month) >= (start_date.year, start_date.month):
+        buckets.append(year * 100 + month)
+        year, month = (year, month - 1) if month > 1 else (year - 1, 12)
+    return buckets
+
+def select_buckets(buckets, start_date=None, end_date=None):
+    # Listed buckets (newest first) that overlap the date range
+    return [bucket for bucket in buckets
+            if (start_date is None or bucket >= month_bucket(start_date))
+            and (end_date is None or bucket <= month_bucket(end_date))]
+
+# Records returned by the query functions, in the column order of their SELECT
+Order = collections.namedtuple('Order', ['email', 'order_date', 'name', 'order_number', 'total_amount', 'status'])
+OrderSummary = collections.namedtuple('OrderSummary', ['email', 'order_date', 'name', 'order_number', 'total_amount',
+                                                       'status', 'item_count', 'shipment_count', 'latest_ship_status'])
+Product = collections.namedtuple('Product', ['order_number', 'product_name', 'price', 'category', 'quantity'])
+# Shipment as stored (shipment_date is the timeuuid), in shipments_by_o_sd column order
+ShipmentRecord = collections.namedtuple('ShipmentRecord', ['order_number', 'shipment_date', 'tracking_number',
+                                                           'ship_status', 'ship_type', 'ship_amount', 'customer_name'])
+Shipment = collections.namedtuple('Shipment', ['order_number', 'ship_date', 'tracking_number', 'ship_status',
+                                               'ship_type', 'ship_amount', 'customer_name'])
+
 # Sample data
 CUSTOMERS = [
     ('juan.perez@email.com', 'Juan Pérez', '+52-33-1234-5678', 'Av. Patria 1234, Zapopan, Jalisco'),
@@ -217,226 +430,801 @@ ORDER_STATUSES = ['Pending', 'Processing', 'Shipped', 'Delivered', 'Cancelled']
 SHIPMENT_STATUSES = ['Pending', 'Shipped', 'In Transit', 'Out for Delivery', 'Delivered', 'Delayed', 'Returned']
 SHIPMENT_TYPES = ['Standard', 'Express', 'Same-day']
 
-def get_date_range():
-    print("\nEnter date range (leave empty for all dates)")
-    start_input = input("Start date (YYYY-MM-DD): ").strip()
-    end_input = input("End date (YYYY-MM-DD): ").strip()
+def parse_date(value):
+    return datetime.datetime.strptime(value, "%Y-%m-%d").date()
 
+# Date range for the Q3.x queries; an empty bound means all dates
+def parse_date_range(start_input, end_input):
     if not start_input or not end_input:
         start_date = datetime.date(2024, 1, 1)
         end_date = datetime.date(2025, 12, 31)
     else:
-        start_date = datetime.datetime.strptime(start_input, "%Y-%m-%d").date()
-        end_date = datetime.datetime.strptime(end_input, "%Y-%m-%d").date()
+        start_date = parse_date(start_input)
+        end_date = parse_date(end_input)
 
     return start_date, end_date
 
-def execute_batch(session, stmt, data):
-    batch_size = 10
-    for i in range(0, len(data), batch_size):
-        batch = BatchStatement()
-        for item in data[i : i+batch_size]:
-            batch.add(stmt, item)
-        session.execute(batch)
-
-def bulk_insert(session):
-    orders_stmt = session.prepare("INSERT INTO orders_by_customers (email, order_date, name, order_number, total_amount, status) VALUES (?, ?, ?, ?, ?, ?)")
-    products_stmt = session.prepare("INSERT INTO products_by_order (order_number, product_name, price, category, quantity) VALUES (?, ?, ?, ?, ?)")
-    shipments_sd_stmt = session.prepare("INSERT INTO shipments_by_o_sd (order_number, shipment_date, tracking_number, ship_status, ship_type, ship_amount, customer_name) VALUES (?, ?, ?, ?, ?, ?, ?)")
-    shipments_ssd_stmt = session.prepare("INSERT INTO shipments_by_o_ssd (order_number, ship_status, shipment_date, tracking_number, ship_type, ship_amount, customer_name) VALUES (?, ?, ?, ?, ?, ?, ?)")
-    shipments_tsd_stmt = session.prepare("INSERT INTO shipments_by_o_tsd (order_number, ship_type, shipment_date, tracking_number, ship_status, ship_amount, customer_name) VALUES (?, ?, ?, ?, ?, ?, ?)")
-    shipments_tssd_stmt = session.prepare("INSERT INTO shipments_by_o_tssd (order_number, ship_type, ship_status, shipment_date, tracking_number, ship_amount, customer_name) VALUES (?, ?, ?, ?, ?, ?, ?)")
-
-    orders_num = 100
-    products_per_order = 3
-    shipments_per_order = 10
-
-    orders_data = []
-    products_data = []
-    shipments_sd_data = []
-    shipments_ssd_data = []
-    shipments_tsd_data = []
-    shipments_tssd_data = []
+class StatementRegistry:
+    # Prepares each statement in STATEMENTS at most once for a session and hands
+    # out the cached PreparedStatement afterwards, so a query costs one round-trip.
+    def __init__(self, session):
+        self.session = session
+        self.cache = None
+        self.bucketed = False
+        self.money_cents = False
+        self._prepared = {}
+        self._lock = threading.Lock()
+
+    def get(self, name):
+        stmt = self._prepared.get(name)
+        if stmt is None:
+            with self._lock:
+                stmt = self._prepared.get(name)
+                if stmt is None:
+                    log.info(f"Preparing statement: {name}")
+                    stmt = self.session.prepare(STATEMENTS[name])
+                    # Every statement here is a read or an upsert, safe to retry or speculate
+                    stmt.is_idempotent = True
+                    self._prepared[name] = stmt
+        return stmt
+
+    def names(self):
+        # Statements for the tables of this session's layout
+        if self.bucketed:
+            return [name for name in STATEMENTS if name not in STATEMENT_TABLES]
+        return [name for name in STATEMENTS if name not in BUCKET_STATEMENTS]
+
+    def prepare_all(self):
+        for name in self.names():
+            self.get(name)
+
+    def reprepare(self, name):
+        with self._lock:
+            self._prepared.pop(name, None)
+        return self.get(name)
+
+    def reset(self):
+        with self._lock:
+            self._prepared.clear()
+
+    def execute(self, name, params, page_size=None, paging_state=None):
+        # The driver re-prepares transparently when a host answers UNPREPARED;
+        # this covers the case where that still surfaces (e.g. after a schema reset).
+        try:
+            return self._execute(self.get(name), params, page_size, paging_state)
+        except PreparedQueryNotFound:
+            log.warning(f"Statement {name} reported as unprepared, re-preparing")
+            return self._execute(self.reprepare(name), params, page_size, paging_state)
+
+    def execute_async(self, name, params, page_size=None):
+        return self.session.execute_async(self.bind(name, params, page_size))
+
+    def bind(self, name, params, page_size=None):
+        return self._bind(self.get(name), params, page_size)
+
+    def _bind(self, stmt, params, page_size):
+        bound = stmt.bind(params)
+        if page_size is not None:
+            bound.fetch_size = page_size
+        return bound
+
+    def _execute(self, stmt, params, page_size, paging_state):
+        return self.session.execute(self._bind(stmt, params, page_size), paging_state=paging_state)
+
+_registries = weakref.WeakKeyDictionary()
+_registries_lock = threading.Lock()
 
+def get_statements(session):
+    with _registries_lock:
+        registry = _registries.get(session)
+        if registry is None:
+            registry = StatementRegistry(session)
+            _registries[session] = registry
+    return registry
+
+# Paging: one page of rows plus the driver's opaque paging_state to resume after it
+# (None on the last page). Pages are fetched on demand, so memory stays bounded by page_size.
+PAGE_SIZE = 100
+
+Page = collections.namedtuple('Page', ['rows', 'paging_state'])
+
+# In the bucketed layout a statement with a bucketed variant reads the buckets that
+# overlap start_date..end_date (see query_buckets) one after another, newest first.
+# Its paging_state is then the bucket being read (4 bytes) followed by the driver's
+# state within it, and a page never spans two buckets, so it can be short.
+def fetch_page(session, name, params, page_size=PAGE_SIZE, paging_state=None, start_date=None, end_date=None):
+    statements = get_statements(session)
+    if not statements.bucketed or name not in STATEMENT_TABLES:
+        result = statements.execute(name, params, page_size, paging_state)
+        return Page(result.current_rows, result.paging_state)
+    buckets = query_buckets(session, name, params, start_date, end_date)
+    if paging_state is not None:
+        current = int.from_bytes(paging_state[:4], 'big')
+        buckets = [bucket for bucket in buckets if bucket <= current]
+        paging_state = paging_state[4:] or None
+    for index, bucket in enumerate(buckets):
+        result = statements.execute(name + BUCKET_SUFFIX, bucket_params(name, params, bucket), page_size, paging_state)
+        paging_state = None
+        if result.paging_state is not None:
+            return Page(result.current_rows, bucket.to_bytes(4, 'big') + result.paging_state)
+        if result.current_rows:
+            following = buckets[index + 1].to_bytes(4, 'big') if index + 1 < len(buckets) else None
+            return Page(result.current_rows, following)
+    return Page([], None)
+
+def iter_pages(session, name, params, page_size=PAGE_SIZE, paging_state=None, start_date=None, end_date=None):
+    while True:
+        page = fetch_page(session, name, params, page_size, paging_state, start_date, end_date)
+        yield page
+        if page.paging_state is None:
+            return
+        paging_state = page.paging_state
+
+def iter_rows(session, name, params, page_size=PAGE_SIZE, paging_state=None, start_date=None, end_date=None):
+    for page in iter_pages(session, name, params, page_size, paging_state, start_date, end_date):
+        yield from page.rows
+
+# Optional read-through cache for the query functions of a session
+def enable_cache(session, max_entries=cache.MAX_ENTRIES, default_ttl=cache.DEFAULT_TTL, ttls=None):
+    statements = get_statements(session)
+    statements.cache = cache.QueryCache(max_entries, default_ttl, ttls)
+    return statements.cache
+
+# Drops cached results for the given order numbers / emails after they were written
+def invalidate_keys(session, *partition_keys):
+    query_cache = get_statements(session).cache
+    if query_cache is not None:
+        for partition_key in partition_keys:
+            query_cache.invalidate(partition_key)
+
+# Switches a session to the time-bucketed tables (see BUCKET_SUFFIX)
+def enable_buckets(session):
+    get_statements(session).bucketed = True
+
+# Switches a session to money columns in integer cents (see MONEY_COLUMNS)
+def enable_money_cents(session):
+    get_statements(session).money_cents = True
+
+def bucket_params(name, params, bucket):
+    return [params[0], bucket] + list(params[1:])
+
+def query_buckets(session, name, params, start_date=None, end_date=None):
+    # Buckets a bucketed query has to read, newest first
+    if start_date is not None and end_date is not None:
+        return month_buckets(start_date, end_date)
+    index_name = BUCKETED_TABLES[STATEMENT_TABLES[name]][2]
+    listed = [row[0] for row in iter_rows(session, 'partition_buckets', [index_name, params[0]])]
+    return select_buckets(listed, start_date, end_date)
+
+def query_rows(session, name, params, page_size=PAGE_SIZE, start_date=None, end_date=None):
+    # All rows of a query. In the bucketed layout it runs once per bucket that
+    # overlaps start_date..end_date, at most MAX_BUCKET_FANOUT at a time, and the
+    # rows come bucket by bucket, newest first, each bucket in its table's clustering
+    # order. Buckets do not overlap in time, so that is date descending whenever the
+    # clustering columns before shipment_date / order_date are fixed by the query
+    # (every Q1 and Q3.x statement); shipment_statuses_* on the _ssd, _tsd and _tssd
+    # tables come grouped by month, then by status or type.
+    statements = get_statements(session)
+    if not statements.bucketed or name not in STATEMENT_TABLES:
+        return list(iter_rows(session, name, params, page_size))
+    rows = []
+    futures = collections.deque()
+    for bucket in query_buckets(session, name, params, start_date, end_date):
+        futures.append(statements.execute_async(name + BUCKET_SUFFIX, bucket_params(name, params, bucket), page_size))
+        if len(futures) >= MAX_BUCKET_FANOUT:
+            rows.extend(futures.popleft().result())
+    while futures:
+        rows.extend(futures.popleft().result())
+    return rows
+
+def _query(session, name, params, record, page_size=PAGE_SIZE, start_date=None, end_date=None):
+    label = metrics.statement_label(name)
+    query_cache = get_statements(session).cache
+    if query_cache is not None:
+        # On a miss the cache hands back its generation, for put
+        found, cached = query_cache.get(name, params)
+        if found:
+            metrics.REGISTRY.cache_hit(label)
+            return list(cached)
+        metrics.REGISTRY.cache_miss(label)
+        generation = cached
+    started = time.perf_counter()
+    try:
+        records = [record._make(row) for row in query_rows(session, name, params, page_size, start_date, end_date)]
+    except Exception as exc:
+        metrics.REGISTRY.error(label, exc)
+        raise
+    metrics.REGISTRY.observe(label, time.perf_counter() - started, len(records))
+    if query_cache is not None:
+        query_cache.put(name, params, records, generation)
+    return list(records)
+
+# One page of a query as records, bypassing the query cache: Page(records, paging_state),
+# where paging_state (None after the last page) resumes the query in a later call
+def _query_page(session, name, params, record, page_size=PAGE_SIZE, paging_state=None, start_date=None, end_date=None):
+    label = metrics.statement_label(name)
+    started = time.perf_counter()
+    try:
+        page = fetch_page(session, name, params, page_size, paging_state, start_date, end_date)
+    except Exception as exc:
+        metrics.REGISTRY.error(label, exc)
+        raise
+    records = [record._make(row) for row in page.rows]
+    metrics.REGISTRY.observe(label, time.perf_counter() - started, len(records))
+    return Page(records, page.paging_state)
+
+# Shipment query planner. Picks the table whose clustering columns cover the most
+# equality filters (or the given table); filters the table cannot apply are
+# checked client-side as residual filters.
+ShipmentPlan = collections.namedtuple('ShipmentPlan', ['table', 'statement', 'params', 'residual', 'start_date', 'end_date'])
+
+def date_bounds(start_date=None, end_date=None):
+    # Date bounds are turned into timeuuid bounds here, like minTimeuuid/maxTimeuuid would
+    bounds = []
+    if start_date is not None:
+        bounds.append(timeuuids.min_timeuuid(start_date))
+    if end_date is not None:
+        bounds.append(timeuuids.max_timeuuid(end_date))
+    return bounds
+
+def plan_shipments(order_number, ship_status=None, ship_type=None, start_date=None, end_date=None, table=None):
+    filters = {'ship_status': ship_status, 'ship_type': ship_type}
+    filters = {column: value for column, value in filters.items() if value is not None}
+
+    candidates = [table] if table is not None else list(SHIPMENT_TABLES)
+    usable = [name for name in candidates if set(SHIPMENT_TABLES[name]) <= set(filters)]
+    if not usable:
+        raise ValueError(f"Table {table} cannot serve filters {sorted(filters)}")
+    table = max(usable, key=lambda name: len(SHIPMENT_TABLES[name]))
+
+    columns = SHIPMENT_TABLES[table]
+    params = [order_number] + [filters[column] for column in columns] + date_bounds(start_date, end_date)
+    statement = table + DATE_RANGES[(start_date is not None, end_date is not None)]
+    residual = {column: value for column, value in filters.items() if column not in columns}
+    return ShipmentPlan(table, statement, params, residual, start_date, end_date)
+
+def apply_residual(plan, shipments):
+    if plan.residual:
+        shipments = [shipment for shipment in shipments
+                     if all(getattr(shipment, column) == value for column, value in plan.residual.items())]
+    return shipments
+
+def run_shipment_plan(session, plan, page_size=PAGE_SIZE):
+    shipments = _query(session, plan.statement, plan.params, Shipment, page_size, plan.start_date, plan.end_date)
+    return apply_residual(plan, shipments)
+
+def find_shipments(session, order_number, ship_status=None, ship_type=None, start_date=None, end_date=None,
+                   table=None, page_size=PAGE_SIZE):
+    plan = plan_shipments(order_number, ship_status, ship_type, start_date, end_date, table)
+    log.info(f"Retrieving shipments for order: {order_number} from {plan.table}")
+    return run_shipment_plan(session, plan, page_size)
+
+# Q3.x one page at a time. Residual filters apply within the page, so a page can
+# hold fewer than page_size rows (even none) before the last one.
+def find_shipments_page(session, order_number, ship_status=None, ship_type=None, start_date=None, end_date=None,
+                        table=None, page_size=PAGE_SIZE, paging_state=None):
+    plan = plan_shipments(order_number, ship_status, ship_type, start_date, end_date, table)
+    log.info(f"Retrieving a page of shipments for order: {order_number} from {plan.table}")
+    page = _query_page(session, plan.statement, plan.params, Shipment, page_size, paging_state,
+                       plan.start_date, plan.end_date)
+    return Page(apply_residual(plan, page.rows), page.paging_state)
+
+# Multi-order lookups for back-office jobs. lookup(order_number) runs on a pool
+# of window threads and (order_number, result) pairs are yielded as each one
+# completes. Keys are grouped by the replica that owns them and the groups are
+# interleaved, so the in-flight window is spread over the nodes instead of
+# following token order onto one node at a time.
+LOOKUP_WINDOW = 128
+
+def replica_order(session, name, keys):
+    keys = list(dict.fromkeys(keys))
+    statements = get_statements(session)
+    if statements.bucketed and name in STATEMENT_TABLES:
+        # Partitions are (key, bucket): a key has no single owner
+        return keys
+    stmt = statements.get(name)
+    metadata = session.cluster.metadata
+    groups = collections.OrderedDict()
+    for key in keys:
+        replicas = metadata.get_replicas(stmt.keyspace, stmt.bind([key]).routing_key)
+        groups.setdefault(replicas[0] if replicas else None, []).append(key)
+    return [key for group in itertools.zip_longest(*groups.values()) for key in group if key is not None]
+
+def lookup_many(session, name, keys, lookup, window=LOOKUP_WINDOW):
+    started = time.perf_counter()
+    count = 0
+    with ThreadPoolExecutor(max_workers=window) as pool:
+        pending = {}
+        for key in replica_order(session, name, keys):
+            if len(pending) >= window:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    count += 1
+                    yield pending.pop(future), future.result()
+            pending[pool.submit(lookup, key)] = key
+        for future in as_completed(pending):
+            count += 1
+            yield pending[future], future.result()
+    log.info(f"Looked up {name} for {count} orders in {time.perf_counter() - started:.2f}s")
+
+# Q2 for many orders: yields (order_number, [Product, ...]) as each completes
+def get_products_for_orders(session, order_numbers, page_size=PAGE_SIZE, window=LOOKUP_WINDOW):
+    lookup = lambda order_number: _query(session, 'products_by_order', [order_number], Product, page_size)
+    return lookup_many(session, 'products_by_order', order_numbers, lookup, window)
+
+# Q3.x for many orders with the same filters: yields (order_number, [Shipment, ...])
+def get_shipments_for_orders(session, order_numbers, ship_status=None, ship_type=None, start_date=None,
+                             end_date=None, table=None, page_size=PAGE_SIZE, window=LOOKUP_WINDOW):
+    plan = plan_shipments(None, ship_status, ship_type, start_date, end_date, table)
+    lookup = lambda order_number: run_shipment_plan(session, plan._replace(params=[order_number] + plan.params[1:]),
+                                                    page_size)
+    return lookup_many(session, plan.statement, order_numbers, lookup, window)
+
+# Rows for each table written by bulk_insert, derived from one generated order record
+ORDER_TABLES = [
+    ('insert_orders_by_customers', 'orders_by_customers', lambda record: [record[0]]),
+    ('insert_order_summaries_by_customer', 'order_summaries_by_customer', lambda record: [order_summary(*record)]),
+    ('insert_products_by_order', 'products_by_order', lambda record: record[1]),
+    ('insert_shipments_by_o_sd', 'shipments_by_o_sd', lambda record: record[2]),
+    ('insert_shipments_by_o_ssd', 'shipments_by_o_ssd',
+     lambda record: [(o, st, sd, tn, ty, amt, cn) for o, sd, tn, st, ty, amt, cn in record[2]]),
+    ('insert_shipments_by_o_tsd', 'shipments_by_o_tsd',
+     lambda record: [(o, ty, sd, tn, st, amt, cn) for o, sd, tn, st, ty, amt, cn in record[2]]),
+    ('insert_shipments_by_o_tssd', 'shipments_by_o_tssd',
+     lambda record: [(o, ty, st, sd, tn, amt, cn) for o, sd, tn, st, ty, amt, cn in record[2]]),
+]
+
+def _bucketed_rows(split, date_index):
+    return lambda record: [(month_bucket(row[date_index]),) + tuple(row) for row in split(record)]
+
+def partition_bucket_rows(record):
+    order, _, shipments = record
+    rows = [('orders_by_customers', order[0], month_bucket(order[1]))]
+    rows.extend(('shipments', order[3], bucket) for bucket in sorted({month_bucket(row[1]) for row in shipments}))
+    return rows
+
+# ORDER_TABLES for the bucketed layout: bucketed inserts get the bucket of their
+# date column in front, and partition_buckets lists every bucket written
+def order_tables(bucketed=False):
+    if not bucketed:
+        return ORDER_TABLES
+    tables = []
+    for name, label, split in ORDER_TABLES:
+        if name in STATEMENT_TABLES:
+            date_column = BUCKETED_TABLES[STATEMENT_TABLES[name]][1]
+            split = _bucketed_rows(split, _insert_columns(name).index(date_column))
+            name, label = name + BUCKET_SUFFIX, label + BUCKET_SUFFIX
+        tables.append((name, label, split))
+    tables.append(('insert_partition_bucket', 'partition_buckets', partition_bucket_rows))
+    return tables
+
+ORDERS_NUM = 100
+PRODUCTS_PER_ORDER = 3
+SHIPMENTS_PER_ORDER = 10
+CHUNK_SIZE = 1000
+
+DATE_FROM = datetime.datetime(2024, 1, 1)
+DATE_TO = datetime.datetime(2025, 12, 31)
+
+# Yields (order, products, shipments) per order: the orders_by_customers row, its
+# products_by_order rows and its shipments_by_o_sd rows. Same seed, same data.
+# With first_order set, order numbers are sequential from it instead of random.
+# With money_cents, amounts are integer cents and the shipment amounts of an order
+# add up exactly to its total.
+def generate_orders(orders_num=ORDERS_NUM, products_per_order=PRODUCTS_PER_ORDER,
+                    shipments_per_order=SHIPMENTS_PER_ORDER, seed=None, first_order=None, money_cents=False):
+    rng = random.Random(seed)
     for i in range(orders_num):
-        customer = random.choice(CUSTOMERS)
-        order_number = f"ORD-{uuid.uuid4().hex[:8].upper()}"
-        order_date = random_date(datetime.datetime(2024, 1, 1), datetime.datetime(2025, 12, 31))
+        customer = rng.choice(CUSTOMERS)
+        if first_order is None:
+            order_number = f"ORD-{random_uuid(rng).hex[:8].upper()}"
+        else:
+            order_number = sequential_order_number(first_order + i)
+        order_date = random_date(DATE_FROM, DATE_TO, rng)
         total_amount = 0
 
-        selected_products = random.sample(PRODUCTS, products_per_order)
+        products = []
+        selected_products = rng.sample(PRODUCTS, products_per_order)
         for product_name, category, price in selected_products:
-            quantity = random.randint(1, 3)
+            if money_cents:
+                price = to_cents(price)
+            quantity = rng.randint(1, 3)
             total_amount += price * quantity
-            products_data.append((order_number, product_name, price, category, quantity))
-
-        status = random.choice(ORDER_STATUSES)
-        orders_data.append((customer[0], order_date, customer[1], order_number, total_amount, status))
-
-        for j in range(shipments_per_order):
-            tracking_number = f"TRK-{uuid.uuid4().hex[:10].upper()}"
-            shipment_date = random_date(datetime.datetime(2024, 1, 1), datetime.datetime(2025, 12, 31))
-            ship_status = random.choice(SHIPMENT_STATUSES)
-            ship_type = random.choice(SHIPMENT_TYPES)
-            ship_amount = total_amount / shipments_per_order
-
-            shipments_sd_data.append((order_number, shipment_date, tracking_number, ship_status, ship_type, ship_amount, customer[1]))
-            shipments_ssd_data.append((order_number, ship_status, shipment_date, tracking_number, ship_type, ship_amount, customer[1]))
-            shipments_tsd_data.append((order_number, ship_type, shipment_date, tracking_number, ship_status, ship_amount, customer[1]))
-            shipments_tssd_data.append((order_number, ship_type, ship_status, shipment_date, tracking_number, ship_amount, customer[1]))
-
-    execute_batch(session, orders_stmt, orders_data)
-    execute_batch(session, products_stmt, products_data)
-    execute_batch(session, shipments_sd_stmt, shipments_sd_data)
-    execute_batch(session, shipments_ssd_stmt, shipments_ssd_data)
-    execute_batch(session, shipments_tsd_stmt, shipments_tsd_data)
-    execute_batch(session, shipments_tssd_stmt, shipments_tssd_data)
-
-def random_date(start_date, end_date):
-    time_between_dates = end_date - start_date
-    days_between_dates = time_between_dates.days
-    random_number_of_days = random.randrange(days_between_dates)
-    rand_date = start_date + datetime.timedelta(days=random_number_of_days)
-    return time_uuid.TimeUUID.with_timestamp(time_uuid.mkutime(rand_date))
+            products.append((order_number, product_name, price, category, quantity))
+
+        status = rng.choice(ORDER_STATUSES)
+        order = (customer[0], order_date, customer[1], order_number, total_amount, status)
+
+        shipments = []
+        shipment_dates = random_dates(DATE_FROM, DATE_TO, shipments_per_order, rng)
+        if money_cents:
+            base, extra = divmod(total_amount, shipments_per_order or 1)
+        for n, shipment_date in enumerate(shipment_dates):
+            tracking_number = f"TRK-{random_uuid(rng).hex[:10].upper()}"
+            ship_status = rng.choice(SHIPMENT_STATUSES)
+            ship_type = rng.choice(SHIPMENT_TYPES)
+            if money_cents:
+                ship_amount = base + (1 if n < extra else 0)
+            else:
+                ship_amount = total_amount / shipments_per_order
+            shipments.append((order_number, shipment_date, tracking_number, ship_status, ship_type, ship_amount, customer[1]))
+
+        yield order, products, shipments
+
+# order_summaries_by_customer row for an order row, its product rows and its
+# shipments_by_o_sd rows (in any order). The latest shipment is the one the table's
+# clustering order puts first, ties on the same timestamp included.
+def order_summary(order, products, shipments):
+    email, order_date, name, order_number, total_amount, status = order
+    item_count = sum(product[4] for product in products)
+    latest = max(shipments, key=lambda shipment: timeuuids.sort_key(shipment[1]), default=None)
+    latest_ship_status = latest[3] if latest is not None else None
+    return (email, order_date, name, order_number, total_amount, status, item_count, len(shipments), latest_ship_status)
+
+def bulk_insert(session, orders_num=ORDERS_NUM, products_per_order=PRODUCTS_PER_ORDER,
+                shipments_per_order=SHIPMENTS_PER_ORDER, seed=None, chunk_size=CHUNK_SIZE,
+                first_order=None):
+    statements = get_statements(session)
+    tables = order_tables(statements.bucketed)
+    records = generate_orders(orders_num, products_per_order, shipments_per_order, seed, first_order,
+                              statements.money_cents)
+    streams = loader.split_stream(records, [rows for _, _, rows in tables], chunk_size)
+    on_written = None
+    if statements.cache is not None:
+        on_written = lambda partition_key: statements.cache.invalidate(partition_key[0])
+    return loader.BulkLoader(session, on_written=on_written).load_all([
+        (statements.get(name), stream, label)
+        for (name, label, _), stream in zip(tables, streams)
+    ])
+
+def sequential_order_number(n):
+    return f"ORD-{n:08X}"
+
+def random_uuid(rng=random):
+    return uuid.UUID(int=rng.getrandbits(128), version=4)
+
+# TimeUUIDs for count random days between start_date and end_date
+def random_dates(start_date, end_date, count, rng=random):
+    days_between_dates = (end_date - start_date).days
+    rand_dates = [start_date + datetime.timedelta(days=rng.randrange(days_between_dates)) for _ in range(count)]
+    return timeuuids.from_timestamps(rand_dates, rng)
+
+def random_date(start_date, end_date, rng=random):
+    return random_dates(start_date, end_date, 1, rng)[0]
 
 def create_keyspace(session, keyspace, replication_factor):
     log.info(f"Creating keyspace: {keyspace} with replication factor {replication_factor}")
     session.execute(CREATE_KEYSPACE.format(keyspace, replication_factor))
 
-def create_schema(session):
-    log.info("Creating logistics schema")
-    session.execute(CREATE_ORDERS_BY_CUSTOMERS_TABLE)
-    session.execute(CREATE_PRODUCTS_BY_ORDER_TABLE)
-    session.execute(CREATE_SHIPMENTS_BY_O_SD_TABLE)
-    session.execute(CREATE_SHIPMENTS_BY_O_SSD_TABLE)
-    session.execute(CREATE_SHIPMENTS_BY_O_TSD_TABLE)
-    session.execute(CREATE_SHIPMENTS_BY_O_TSSD_TABLE)
+# CREATE TABLE statement of every table of a layout, by table name
+def schema_tables(bucketed=False, money_cents=False):
+    tables = {}
+    for table, create_table in TABLE_SCHEMAS.items():
+        if bucketed and table in BUCKETED_TABLES:
+            tables[table + BUCKET_SUFFIX] = bucketed_table(create_table, table)
+        else:
+            tables[table] = create_table
+    if bucketed:
+        tables['partition_buckets'] = CREATE_PARTITION_BUCKETS_TABLE
+    if money_cents:
+        tables = {table: create_table.replace(" DECIMAL,", " BIGINT,") for table, create_table in tables.items()}
+    return tables
+
+def check_money_columns(tables, money_cents=False):
+    # tables: the keyspace's table metadata. Cents bound to DECIMAL columns (or
+    # amounts to BIGINT ones) would be stored wrong, so a mismatch is an error.
+    expected = MONEY_TYPES[money_cents]
+    for name, table in tables.items():
+        for column in MONEY_COLUMNS:
+            if column in table.columns and table.columns[column].cql_type != expected:
+                raise ValueError(f"{name}.{column} is {table.columns[column].cql_type}, not {expected}: "
+                                 f"set money_cents to {not money_cents} or use a new keyspace")
+
+# With bucketed, orders and shipments tables use the time-bucketed layout
+# (see BUCKET_SUFFIX), with money_cents amounts are BIGINT cents, and the
+# session's queries and loads switch to them
+def create_schema(session, bucketed=False, money_cents=False):
+    log.info(f"Creating logistics schema{' (bucketed by month)' if bucketed else ''}")
+    for create_table in schema_tables(bucketed, money_cents).values():
+        session.execute(create_table)
+    statements = get_statements(session)
+    statements.reset()
+    statements.bucketed = bucketed
+    statements.money_cents = money_cents
+
+# Idempotent schema migration: creates the keyspace and the tables of the layout
+# that cluster.metadata does not know yet, so an up-to-date schema costs no DDL
+# round-trips or schema agreement waits. Uses the keyspace and returns the
+# names of the tables it created.
+def migrate(session, keyspace, replication_factor=1, bucketed=False, money_cents=False):
+    metadata = session.cluster.metadata
+    if keyspace not in metadata.keyspaces:
+        create_keyspace(session, keyspace, replication_factor)
+    session.set_keyspace(keyspace)
+    keyspace_metadata = metadata.keyspaces.get(keyspace)
+    existing = keyspace_metadata.tables if keyspace_metadata is not None else {}
+    check_money_columns(existing, money_cents)
+    created = []
+    for table, create_table in schema_tables(bucketed, money_cents).items():
+        if table not in existing:
+            log.info(f"Creating table: {table}")
+            session.execute(create_table)
+            created.append(table)
+    statements = get_statements(session)
+    if created:
+        statements.reset()
+    statements.bucketed = bucketed
+    statements.money_cents = money_cents
+    log.info(f"Schema of {keyspace} up to date, {len(created)} tables created")
+    return created
 
 # Q1: Get orders by customer
-def get_orders_by_customer(session, email):
+def get_orders_by_customer(session, email, page_size=PAGE_SIZE, start_date=None, end_date=None):
     log.info(f"Retrieving orders for customer: {email}")
-    stmt = session.prepare(SELECT_ORDERS_BY_CUSTOMER)
-    rows = session.execute(stmt, [email])
-    
-    print(f"\n=== Orders for customer: {email} ===")
-    for row in rows:
-        print(f"Order: {row.order_number}")
-        print(f"  - Date: {row.order_date_readable}")
-        print(f"  - Customer: {row.name}")
-        print(f"  - Total: ${row.total_amount:,.2f}")
-        print(f"  - Status: {row.status}")
-        print()
+    name = 'orders_by_customer' + DATE_RANGES[(start_date is not None, end_date is not None)]
+    params = [email] + date_bounds(start_date, end_date)
+    return _query(session, name, params, Order, page_size, start_date, end_date)
+
+# Q1 one page at a time (see Page)
+def get_orders_by_customer_page(session, email, page_size=PAGE_SIZE, paging_state=None, start_date=None, end_date=None):
+    log.info(f"Retrieving a page of orders for customer: {email}")
+    name = 'orders_by_customer' + DATE_RANGES[(start_date is not None, end_date is not None)]
+    params = [email] + date_bounds(start_date, end_date)
+    return _query_page(session, name, params, Order, page_size, paging_state, start_date, end_date)
+
+# Q1 for the dashboard: orders with item count, shipment count and latest shipment status
+def get_order_summaries(session, email, page_size=PAGE_SIZE):
+    log.info(f"Retrieving order summaries for customer: {email}")
+    return _query(session, 'order_summaries_by_customer', [email], OrderSummary, page_size)
+
+def get_order_summaries_page(session, email, page_size=PAGE_SIZE, paging_state=None):
+    log.info(f"Retrieving a page of order summaries for customer: {email}")
+    return _query_page(session, 'order_summaries_by_customer', [email], OrderSummary, page_size, paging_state)
+
+# {table: {shipment_date: {ship_status, ...}}} of an order's shipments in every
+# shipments table, each in its table's clustering order
+def shipment_statuses(session, order_number):
+    statuses = {}
+    for table in SHIPMENT_TABLES:
+        by_date = {}
+        for shipment_date, ship_status in query_rows(session, 'shipment_statuses_' + table, [order_number]):
+            by_date.setdefault(shipment_date, set()).add(ship_status)
+        statuses[table] = by_date
+    return statuses
+
+def statuses_diverge(statuses):
+    # A shipment with several statuses in one table, or tables that disagree
+    tables = list(statuses.values())
+    return (any(len(states) > 1 for by_date in tables for states in by_date.values())
+            or any(by_date != tables[0] for by_date in tables[1:]))
+
+# Recomputes every order summary of the given customers (default: the sample
+# customers) from orders_by_customers, products_by_order and shipments_by_o_sd,
+# bypassing the query cache. Reports summaries that are missing, differ from the
+# base tables or have no base order, and orders whose shipments tables disagree
+# (divergent); with repair, rewrites missing and stale summaries.
+def check_order_summaries(session, emails=None, repair=False):
+    statements = get_statements(session)
+    emails = emails or [customer[0] for customer in CUSTOMERS]
+    report = {'orders': 0, 'missing': [], 'stale': [], 'orphaned': [], 'divergent': [], 'repaired': 0}
+    for email in emails:
+        summaries = {row[3]: OrderSummary._make(row) for row in iter_rows(session, 'order_summaries_by_customer', [email])}
+        orders = [tuple(order) for order in query_rows(session, 'order_keys_by_customer', [email])]
+        order_numbers = [order[3] for order in orders]
+        products = dict(lookup_many(session, 'products_by_order', order_numbers,
+                                    lambda order_number: list(iter_rows(session, 'products_by_order', [order_number]))))
+        statuses = dict(lookup_many(session, 'shipments_by_o_sd', order_numbers,
+                                    lambda order_number: shipment_statuses(session, order_number)))
+        for order in orders:
+            order_number = order[3]
+            report['orders'] += 1
+            if statuses_diverge(statuses[order_number]):
+                report['divergent'].append(order_number)
+            # shipments_by_o_sd is clustered by shipment_date DESC: the first row is the latest
+            order_products, order_shipments = products[order_number], statuses[order_number]['shipments_by_o_sd']
+            latest = next(iter(order_shipments.values()), None)
+            expected = order + (sum(product[4] for product in order_products), len(order_shipments),
+                                min(latest) if latest else None)
+            actual = summaries.pop(order_number, None)
+            if actual is None:
+                report['missing'].append(order_number)
+            elif actual[3:] != expected[3:]:
+                report['stale'].append(order_number)
+            else:
+                continue
+            if repair:
+                session.execute(statements.bind('insert_order_summaries_by_customer', expected),
+                                execution_profile=loader.bulk_profile(session))
+                report['repaired'] += 1
+        report['orphaned'].extend(summaries)
+        if repair:
+            invalidate_keys(session, email)
+    log.info(f"Checked order summaries: {report['orders']} orders, {len(report['missing'])} missing, "
+             f"{len(report['stale'])} stale, {len(report['orphaned'])} orphaned, {len(report['divergent'])} divergent, "
+             f"{report['repaired']} repaired")
+    return report
 
 # Q2: Get products by order
 def get_products_by_order(session, order_number):
     log.info(f"Retrieving products for order: {order_number}")
-    stmt = session.prepare(SELECT_PRODUCTS_BY_ORDER)
-    rows = session.execute(stmt, [order_number])
-
-    print(f"\n=== Products for order: {order_number} ===")
-    total = 0
-    for row in rows:
-        subtotal = row.price * row.quantity
-        total += subtotal
-        print(f"Product: {row.product_name}")
-        print(f"  - Category: {row.category}")
-        print(f"  - Price:    ${row.price:,.2f}")
-        print(f"  - Quantity: {row.quantity}")
-        print(f"  - Subtotal: ${subtotal:,.2f}")
-        print()
-    print(f"Total: ${total:,.2f}")
+    return _query(session, 'products_by_order', [order_number], Product)
+
+def get_products_by_order_page(session, order_number, page_size=PAGE_SIZE, paging_state=None):
+    log.info(f"Retrieving a page of products for order: {order_number}")
+    return _query_page(session, 'products_by_order', [order_number], Product, page_size, paging_state)
+
+# Shipment writes. One logical change goes to the four shipments tables at once,
+# one single-partition request per table (an UNLOGGED batch when the table needs
+# a delete and an insert), all with the same write time, on the bulk profile. Each change is recorded
+# in metrics with the rows it wrote (write amplification) and the tombstones it
+# left: deleted rows plus null cells written by inserts.
+WriteResult = collections.namedtuple('WriteResult', ['shipment', 'requests', 'mutations', 'tombstones', 'seconds'])
+
+def write_time():
+    # Microseconds since the epoch, the unit of Cassandra write times
+    return time.time_ns() // 1000
+
+def _write_values(session, shipment, timestamp):
+    values = shipment._asdict()
+    values['write_time'] = timestamp
+    if get_statements(session).bucketed:
+        values['bucket'] = month_bucket(shipment.shipment_date)
+    return values
+
+def _apply_writes(session, label, shipment, requests):
+    # requests: {table: [(statement name, values), ...]}
+    statements = get_statements(session)
+    profile = loader.bulk_profile(session)
+    started = time.perf_counter()
+    mutations = tombstones = 0
+    futures = []
+    for table, writes in requests.items():
+        bound = []
+        for name, values in writes:
+            if statements.bucketed and name in STATEMENT_TABLES:
+                name += BUCKET_SUFFIX
+            bound.append(statements.bind(name, values))
+            mutations += 1
+            if name.startswith('delete_'):
+                tombstones += 1
+            elif name.startswith('insert_') and isinstance(values, dict):
+                tombstones += sum(1 for column in shipment._fields if values[column] is None)
+        if len(bound) == 1:
+            request = bound[0]
+        else:
+            request = BatchStatement(batch_type=BatchType.UNLOGGED)
+            for statement in bound:
+                request.add(statement)
+        request.is_idempotent = True
+        futures.append(session.execute_async(request, execution_profile=profile))
+    try:
+        for future in futures:
+            future.result()
+    except Exception as exc:
+        metrics.REGISTRY.error(label, exc)
+        raise
+    seconds = time.perf_counter() - started
+    metrics.REGISTRY.write(label, seconds, mutations, tombstones)
+    invalidate_keys(session, shipment.order_number)
+    log.info(f"{label} {shipment.order_number}/{shipment.shipment_date}: {len(futures)} requests, "
+             f"{mutations} rows written, {tombstones} tombstones in {seconds:.3f}s")
+    return WriteResult(shipment, len(futures), mutations, tombstones, seconds)
+
+def get_shipment(session, order_number, shipment_date):
+    # Current row of a shipment, read from shipments_by_o_sd (not cached)
+    day = timeuuids.to_datetime(shipment_date)
+    rows = query_rows(session, 'shipment_by_date', [order_number, shipment_date], start_date=day, end_date=day)
+    return ShipmentRecord._make(rows[0]) if rows else None
+
+def latest_shipment_date(session, order_number):
+    # shipment_date of the order's latest shipment (a one-row read of the newest
+    # bucket that has one), None without shipments
+    rows = fetch_page(session, 'shipment_statuses_shipments_by_o_sd', [order_number], 1).rows
+    return rows[0][0] if rows else None
+
+# (email, order_date) key of an order's summary, for callers that do not have the
+# order_date at hand: reads the customer's whole orders_by_customers partition
+def find_order_key(session, email, order_number):
+    for order in query_rows(session, 'order_keys_by_customer', [email]):
+        if order[3] == order_number:
+            return email, order[1]
+    raise ValueError(f"No order {order_number} for customer {email}")
+
+def _summary_writes(session, order_key, shipment, timestamp, new_shipment=False, latest_status=None):
+    # Writes to the order summary at order_key (a keyed read checks it is the
+    # shipment's order): one more shipment and/or a new latest_ship_status
+    email, order_date = order_key
+    rows = get_statements(session).execute('order_summary_by_key', [email, order_date]).current_rows
+    if not rows or rows[0][0] != shipment.order_number:
+        raise ValueError(f"No summary of order {shipment.order_number} at {email}/{order_date}")
+    values = {'email': email, 'order_date': order_date, 'write_time': timestamp}
+    writes = []
+    if new_shipment:
+        writes.append(('update_order_summary_count', dict(values, shipment_count=(rows[0][1] or 0) + 1)))
+    if latest_status is not None:
+        writes.append(('update_order_summary_status', dict(values, new_status=latest_status)))
+    return writes
+
+# Writes a new shipment (a ShipmentRecord or a tuple in its order) to every
+# shipments table. timestamp: write time in microseconds, default now. With
+# order_key, the (email, order_date) of its order, the order summary gets the new
+# shipment_count and, when this is the order's latest shipment, its status.
+# Concurrent new shipments of one order can lose a count; check --repair fixes it.
+def record_shipment(session, shipment, timestamp=None, order_key=None):
+    shipment = ShipmentRecord._make(shipment)
+    timestamp = timestamp or write_time()
+    values = _write_values(session, shipment, timestamp)
+    requests = {table: [(f"insert_{table}_at", values)] for table in SHIPMENT_TABLES}
+    if get_statements(session).bucketed:
+        requests['partition_buckets'] = [('insert_partition_bucket', ['shipments', shipment.order_number, values['bucket']])]
+    if order_key is not None:
+        # Rewriting an existing shipment does not change the count
+        exists = get_shipment(session, shipment.order_number, shipment.shipment_date) is not None
+        latest = latest_shipment_date(session, shipment.order_number)
+        is_latest = latest is None or timeuuids.sort_key(shipment.shipment_date) >= timeuuids.sort_key(latest)
+        requests['order_summaries_by_customer'] = _summary_writes(
+            session, order_key, shipment, timestamp,
+            new_shipment=not exists,
+            latest_status=shipment.ship_status if is_latest else None)
+    result = _apply_writes(session, 'record_shipment', shipment, requests)
+    if order_key is not None:
+        invalidate_keys(session, order_key[0])
+    return result
+
+# Moves a shipment (its current row, see get_shipment) to new_status in every
+# shipments table. Replaying the same change with the same timestamp is harmless.
+# Where ship_status is part of the key, the change deletes the row under the status
+# it read and inserts the new one. Every write carries the change's timestamp, so a
+# chain of changes applied out of order still ends on the newest one: a late
+# X -> A loses its insert of A to the newer A -> B's delete of A. Two changes made
+# from the same read (X -> A and X -> B) leave both rows there; check reports that
+# as divergent. With order_key, the (email, order_date) of its order, the change
+# also sets the summary's latest_ship_status when this is the order's latest
+# shipment; without it the summary is left for check --repair.
+def update_shipment_status(session, shipment, new_status, timestamp=None, order_key=None):
+    shipment = ShipmentRecord._make(shipment)
+    if new_status not in SHIPMENT_STATUSES:
+        raise ValueError(f"Unknown shipment status {new_status}, expected one of: {', '.join(SHIPMENT_STATUSES)}")
+    updated = shipment._replace(ship_status=new_status)
+    if new_status == shipment.ship_status:
+        return WriteResult(updated, 0, 0, 0, 0.0)
+    timestamp = timestamp or write_time()
+    old_values = _write_values(session, shipment, timestamp)
+    old_values['new_status'] = new_status
+    new_values = _write_values(session, updated, timestamp)
+    requests = {}
+    for table, columns in SHIPMENT_TABLES.items():
+        if 'ship_status' in columns:
+            requests[table] = [(f"delete_{table}_at", old_values), (f"insert_{table}_at", new_values)]
+        else:
+            requests[table] = [(f"update_{table}_at", old_values)]
+    if order_key is not None and latest_shipment_date(session, shipment.order_number) == shipment.shipment_date:
+        requests['order_summaries_by_customer'] = _summary_writes(session, order_key, shipment, timestamp,
+                                                                  latest_status=new_status)
+    result = _apply_writes(session, 'update_shipment_status', shipment, requests)
+    if order_key is not None:
+        invalidate_keys(session, order_key[0])
+    return result._replace(shipment=updated)
 
 # Q3.1: Get all shipments by order (no date filter)
-def get_shipments_by_order(session, order_number):
-    log.info(f"Retrieving shipments for order: {order_number}")
-    stmt = session.prepare(SELECT_SHIPMENTS_BY_ORDER)
-    rows = session.execute(stmt, [order_number])
-
-    print(f"\n=== Shipments for order: {order_number} ===")
-    for row in rows:
-        print(f"Tracking: {row.tracking_number}")
-        print(f"  - Date:   {row.ship_date_readable}")
-        print(f"  - Status: {row.ship_status}")
-        print(f"  - Type:   {row.ship_type}")
-        print(f"  - Amount: ${row.ship_amount:,.2f}")
-        print(f"  - Customer: {row.customer_name}")
-        print()
+def get_shipments_by_order(session, order_number, page_size=PAGE_SIZE):
+    return find_shipments(session, order_number, page_size=page_size)
 
 # Q3.2: Same as Q3.1 (with explicit date range)
-def get_shipments_by_order_date_range(session, order_number, start_date, end_date):
-    log.info(f"Retrieving shipments for order: {order_number} with date range")
-    stmt = session.prepare(SELECT_SHIPMENTS_BY_ORDER_DATE_RANGE)
-    rows = session.execute(stmt, [order_number, start_date, end_date])
-
-    print(f"\n=== Shipments for order: {order_number} (date range) ===")
-    for row in rows:
-        print(f"Tracking: {row.tracking_number}")
-        print(f"  - Date:   {row.ship_date_readable}")
-        print(f"  - Status: {row.ship_status}")
-        print(f"  - Type:   {row.ship_type}")
-        print(f"  - Amount: ${row.ship_amount:,.2f}")
-        print(f"  - Customer: {row.customer_name}")
-        print()
+def get_shipments_by_order_date_range(session, order_number, start_date, end_date, page_size=PAGE_SIZE):
+    return find_shipments(session, order_number, start_date=start_date, end_date=end_date, page_size=page_size)
 
 # Q3.3: Get shipments by order and status with date range
-def get_shipments_by_order_status(session, order_number, status, start_date, end_date):
-    log.info(f"Retrieving shipments for order: {order_number}, status: {status}")
-
-    if start_date and end_date:
-        stmt = session.prepare(SELECT_SHIPMENTS_BY_ORDER_STATUS)
-        rows = session.execute(stmt, [order_number, status, start_date, end_date])
-    else:
-        stmt = session.prepare(SELECT_SHIPMENTS_BY_ORDER_STATUS_NO_DATE)
-        rows = session.execute(stmt, [order_number, status])
-
-    print(f"\n=== Shipments for order: {order_number}, status: {status} ===")
-    for row in rows:
-        print(f"Tracking: {row.tracking_number}")
-        print(f"  - Date:   {row.ship_date_readable}")
-        print(f"  - Status: {row.ship_status}")
-        print(f"  - Type:   {row.ship_type}")
-        print(f"  - Amount: ${row.ship_amount:,.2f}")
-        print(f"  - Customer: {row.customer_name}")
-        print()
+def get_shipments_by_order_status(session, order_number, status, start_date, end_date, page_size=PAGE_SIZE):
+    return find_shipments(session, order_number, ship_status=status, start_date=start_date, end_date=end_date,
+                          page_size=page_size)
 
 # Q3.4: Get shipments by order and type with date range
-def get_shipments_by_order_type(session, order_number, ship_type, start_date, end_date):
-    log.info(f"Retrieving shipments for order: {order_number}, type: {ship_type}")
-
-    if start_date and end_date:
-        stmt = session.prepare(SELECT_SHIPMENTS_BY_ORDER_TYPE)
-        rows = session.execute(stmt, [order_number, ship_type, start_date, end_date])
-    else:
-        stmt = session.prepare(SELECT_SHIPMENTS_BY_ORDER_TYPE_NO_DATE)
-        rows = session.execute(stmt, [order_number, ship_type])
-
-    print(f"\n=== Shipments for order: {order_number}, type: {ship_type} ===")
-    for row in rows:
-        print(f"Tracking: {row.tracking_number}")
-        print(f"  - Date:   {row.ship_date_readable}")
-        print(f"  - Status: {row.ship_status}")
-        print(f"  - Type:   {row.ship_type}")
-        print(f"  - Amount: ${row.ship_amount:,.2f}")
-        print(f"  - Customer: {row.customer_name}")
-        print()
+def get_shipments_by_order_type(session, order_number, ship_type, start_date, end_date, page_size=PAGE_SIZE):
+    return find_shipments(session, order_number, ship_type=ship_type, start_date=start_date, end_date=end_date,
+                          page_size=page_size)
 
 # Q3.5: Get shipments by order, type and status with date range
-def get_shipments_by_order_type_status(session, order_number, ship_type, status, start_date, end_date):
-    log.info(f"Retrieving shipments for order: {order_number}, type: {ship_type}, status: {status}")
-
-    if start_date and end_date:
-        stmt = session.prepare(SELECT_SHIPMENTS_BY_ORDER_TYPE_STATUS)
-        rows = session.execute(stmt, [order_number, ship_type, status, start_date, end_date])
-    else:
-        stmt = session.prepare(SELECT_SHIPMENTS_BY_ORDER_TYPE_STATUS_NO_DATE)
-        rows = session.execute(stmt, [order_number, ship_type, status])
-
-    print(f"\n=== Shipments for order: {order_number}, type: {ship_type}, status: {status} ===")
-    for row in rows:
-        print(f"Tracking: {row.tracking_number}")
-        print(f"  - Date:   {row.ship_date_readable}")
-        print(f"  - Status: {row.ship_status}")
-        print(f"  - Type:   {row.ship_type}")
-        print(f"  - Amount: ${row.ship_amount:,.2f}")
-        print(f"  - Customer: {row.customer_name}")
-        print()
+def get_shipments_by_order_type_status(session, order_number, ship_type, status, start_date, end_date, page_size=PAGE_SIZE):
+    return find_shipments(session, order_number, ship_status=status, ship_type=ship_type, start_date=start_date,
+                          end_date=end_date, page_size=page_size)
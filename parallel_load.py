@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+import logging
+import multiprocessing
+import os
+import random
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import config
+import model
+
+# Set logger
+log = logging.getLogger()
+
+# Order numbers are ORD-XXXXXXXX: 2**32 sequential numbers
+ORDER_NUMBERS = 16 ** 8
+
+def base_order(orders_num, seed):
+    # First order number of a load: the seed picks one of the ORDER_NUMBERS // orders_num
+    # disjoint blocks of orders_num numbers. Loads whose seeds differ modulo that count
+    # never overwrite each other's orders; reloading a seed rewrites the same ones.
+    return seed % max(1, ORDER_NUMBERS // orders_num) * orders_num
+
+def worker_seed(seed, first_order):
+    # Seed of the worker loading from first_order. Unique per (seed, first_order), so
+    # loads with nearby seeds never generate the same order dates (orders_by_customers
+    # keys) the way seed + worker index did; reloading a seed regenerates the same rows.
+    return seed * ORDER_NUMBERS + first_order
+
+def split_orders(orders_num, processes, first_order=0):
+    # Disjoint (first_order, count) ranges covering orders_num orders from first_order
+    base, extra = divmod(orders_num, processes)
+    for i in range(processes):
+        count = base + (1 if i < extra else 0)
+        if count:
+            yield first_order, count
+        first_order += count
+
+def _worker(settings, orders_num, first_order, seed, products_per_order, shipments_per_order):
+    if settings['backend'] == 'memory':
+        # A fresh store per process: create the schema first
+        cluster, session = config.connect(settings, migrate=True)
+    else:
+        cluster = config.build_cluster(settings)
+        session = cluster.connect(settings['keyspace'])
+    try:
+        if settings['bucketed']:
+            model.enable_buckets(session)
+        if settings['money_cents']:
+            model.enable_money_cents(session)
+        started = time.perf_counter()
+        results = model.bulk_insert(session, orders_num, products_per_order, shipments_per_order,
+                                    seed=seed, first_order=first_order)
+        return sum(stats.written for stats in results), time.perf_counter() - started
+    finally:
+        cluster.shutdown()
+
+# Generates and loads orders_num orders across a pool of processes, each with its own
+# Cluster/Session, seed (worker_seed) and range of sequential order numbers.
+# The numbers start at first_order, by default base_order(orders_num, seed).
+def load(settings, orders_num, processes=None, seed=None,
+         products_per_order=model.PRODUCTS_PER_ORDER, shipments_per_order=model.SHIPMENTS_PER_ORDER,
+         first_order=None):
+    processes = processes or os.cpu_count() or 1
+    if seed is None:
+        seed = random.randrange(2 ** 32)
+    if first_order is None:
+        first_order = base_order(orders_num, seed)
+    log.info(f"Loading {orders_num} orders from {model.sequential_order_number(first_order)} "
+             f"with {processes} processes (seed {seed})")
+    if settings['backend'] == 'memory':
+        log.warning("Each process loads its own in-memory store: rows are measured, then dropped")
+
+    started = time.perf_counter()
+    context = multiprocessing.get_context('spawn')
+    with ProcessPoolExecutor(max_workers=processes, mp_context=context) as pool:
+        futures = [
+            pool.submit(_worker, settings, count, first_order, worker_seed(seed, first_order),
+                        products_per_order, shipments_per_order)
+            for first_order, count in split_orders(orders_num, processes, first_order)
+        ]
+        results = [future.result() for future in futures]
+    elapsed = time.perf_counter() - started
+
+    rows = sum(written for written, _ in results)
+    summary = {
+        'orders': orders_num,
+        'processes': processes,
+        'seed': seed,
+        'first_order': model.sequential_order_number(first_order),
+        'rows': rows,
+        'seconds': round(elapsed, 3),
+        'rows_per_sec': round(rows / elapsed if elapsed else 0.0, 1),
+    }
+    log.info(f"Parallel load finished: {summary}")
+    return summary
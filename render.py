@@ -0,0 +1,50 @@
+#!/usr/bin/env python3
+
+# Terminal output for the records returned by the model query functions. With
+# cents, money columns hold integer cents (model.MONEY_COLUMNS).
+
+def money(amount, cents=False):
+    return f"${amount / 100 if cents else amount:,.2f}"
+
+def print_orders(email, orders, cents=False):
+    print(f"\n=== Orders for customer: {email} ===")
+    for order in orders:
+        print(f"Order: {order.order_number}")
+        print(f"  - Date: {order.order_date}")
+        print(f"  - Customer: {order.name}")
+        print(f"  - Total: {money(order.total_amount, cents)}")
+        print(f"  - Status: {order.status}")
+        print()
+
+def print_products(order_number, products, cents=False):
+    print(f"\n=== Products for order: {order_number} ===")
+    total = 0
+    for product in products:
+        subtotal = product.price * product.quantity
+        total += subtotal
+        print(f"Product: {product.product_name}")
+        print(f"  - Category: {product.category}")
+        print(f"  - Price:    {money(product.price, cents)}")
+        print(f"  - Quantity: {product.quantity}")
+        print(f"  - Subtotal: {money(subtotal, cents)}")
+        print()
+    print(f"Total: {money(total, cents)}")
+
+def print_shipments(order_number, shipments, ship_type=None, status=None, date_range=False, cents=False):
+    heading = f"order: {order_number}"
+    if ship_type is not None:
+        heading += f", type: {ship_type}"
+    if status is not None:
+        heading += f", status: {status}"
+    if date_range:
+        heading += " (date range)"
+
+    print(f"\n=== Shipments for {heading} ===")
+    for shipment in shipments:
+        print(f"Tracking: {shipment.tracking_number}")
+        print(f"  - Date:   {shipment.ship_date}")
+        print(f"  - Status: {shipment.ship_status}")
+        print(f"  - Type:   {shipment.ship_type}")
+        print(f"  - Amount: {money(shipment.ship_amount, cents)}")
+        print(f"  - Customer: {shipment.customer_name}")
+        print()
@@ -0,0 +1,59 @@
+#!/usr/bin/env python3
+import cache
+
+def test_hit_after_put_and_miss_after_invalidate():
+    query_cache = cache.QueryCache()
+    found, generation = query_cache.get('orders_by_customer', ['a@x.com'])
+    assert not found
+    query_cache.put('orders_by_customer', ['a@x.com'], ['row'], generation)
+    assert query_cache.get('orders_by_customer', ['a@x.com']) == (True, ['row'])
+    query_cache.invalidate('a@x.com')
+    assert not query_cache.get('orders_by_customer', ['a@x.com'])[0]
+
+def test_rows_read_before_an_invalidation_are_not_stored():
+    query_cache = cache.QueryCache()
+    _, generation = query_cache.get('products_by_order', ['ORD-1'])
+    # A write to the partition lands while the miss is still reading
+    query_cache.invalidate('ORD-1')
+    query_cache.put('products_by_order', ['ORD-1'], ['stale'], generation)
+    assert not query_cache.get('products_by_order', ['ORD-1'])[0]
+    assert query_cache.stats()['discarded'] == 1
+
+def test_invalidating_another_partition_does_not_discard():
+    query_cache = cache.QueryCache()
+    _, generation = query_cache.get('products_by_order', ['ORD-1'])
+    query_cache.invalidate('ORD-2')
+    query_cache.put('products_by_order', ['ORD-1'], ['fresh'], generation)
+    assert query_cache.get('products_by_order', ['ORD-1']) == (True, ['fresh'])
+
+def test_forgotten_invalidations_discard_older_reads():
+    query_cache = cache.QueryCache(max_entries=2)
+    _, generation = query_cache.get('products_by_order', ['ORD-1'])
+    for partition_key in ('ORD-1', 'ORD-2', 'ORD-3'):
+        query_cache.invalidate(partition_key)
+    # ORD-1's invalidation is no longer remembered: the read cannot be proven fresh
+    query_cache.put('products_by_order', ['ORD-1'], ['stale'], generation)
+    assert not query_cache.get('products_by_order', ['ORD-1'])[0]
+
+def test_clear_discards_reads_in_flight():
+    query_cache = cache.QueryCache()
+    _, generation = query_cache.get('products_by_order', ['ORD-1'])
+    query_cache.clear()
+    query_cache.put('products_by_order', ['ORD-1'], ['stale'], generation)
+    assert not query_cache.get('products_by_order', ['ORD-1'])[0]
+
+def test_least_recently_used_entry_is_evicted():
+    query_cache = cache.QueryCache(max_entries=2)
+    for key in ('A', 'B'):
+        query_cache.put('q', [key], key)
+    query_cache.get('q', ['A'])
+    query_cache.put('q', ['C'], 'C')
+    assert query_cache.get('q', ['A'])[0] and query_cache.get('q', ['C'])[0]
+    assert not query_cache.get('q', ['B'])[0]
+
+def test_entries_expire_after_their_statement_ttl():
+    query_cache = cache.QueryCache(default_ttl=60.0, ttls={'short': 0.0})
+    query_cache.put('short', ['A'], 'value')
+    query_cache.put('long', ['A'], 'value')
+    assert not query_cache.get('short', ['A'])[0]
+    assert query_cache.get('long', ['A'])[0]
@@ -0,0 +1,17 @@
+#!/usr/bin/env python3
+import pytest
+
+import config
+
+def test_unknown_consistency_is_rejected(monkeypatch):
+    monkeypatch.setenv('CASSANDRA_READ_CONSISTENCY', 'LOCAL_QUORUMM')
+    with pytest.raises(ValueError, match='read_consistency LOCAL_QUORUMM'):
+        config.load_config(backend='memory')
+    with pytest.raises(ValueError, match='write_consistency ALL_OF_THEM'):
+        config.load_config(backend='memory', read_consistency='ONE', write_consistency='ALL_OF_THEM')
+
+def test_known_consistency_is_accepted():
+    settings = config.load_config(backend='memory', read_consistency='LOCAL_QUORUM', write_consistency='QUORUM')
+    profiles = config.execution_profiles(settings)
+    assert profiles[config.OLTP_PROFILE].consistency_level == config.ConsistencyLevel.LOCAL_QUORUM
+    assert profiles[config.BULK_PROFILE].consistency_level == config.ConsistencyLevel.QUORUM
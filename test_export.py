@@ -0,0 +1,48 @@
+#!/usr/bin/env python3
+import decimal
+import os
+
+import pytest
+
+import config
+import export
+import model
+
+@pytest.mark.parametrize('splits', [1, 7, 64])
+def test_token_ranges_cover_the_ring_without_gaps(splits):
+    ranges = list(export.token_ranges(splits))
+    assert len(ranges) == splits
+    assert ranges[0][0] == export.MIN_TOKEN and ranges[-1][1] == export.MAX_TOKEN
+    assert all(previous[1] == current[0] for previous, current in zip(ranges, ranges[1:]))
+    assert all(start < end for start, end in ranges)
+
+def test_export_reads_every_row_once(tmp_path):
+    pa = pytest.importorskip('pyarrow')
+    import pyarrow.parquet
+    cluster, session = config.connect(config.load_config(backend='memory'))
+    try:
+        model.bulk_insert(session, 200, seed=5, first_order=0)
+        summary = export.export(session, str(tmp_path), ['shipments_by_o_sd', 'products_by_order'], splits=7,
+                                parallelism=3, fetch_size=50)
+        for table, rows in (('shipments_by_o_sd', 200 * model.SHIPMENTS_PER_ORDER),
+                            ('products_by_order', 200 * model.PRODUCTS_PER_ORDER)):
+            data = pa.parquet.read_table(os.path.join(str(tmp_path), table + '.parquet'))
+            key = 'shipment_date' if table == 'shipments_by_o_sd' else 'product_name'
+            assert data.num_rows == rows
+            assert len(set(zip(data.column('order_number').to_pylist(), data.column(key).to_pylist()))) == rows
+        assert summary['rows'] == 200 * (model.SHIPMENTS_PER_ORDER + model.PRODUCTS_PER_ORDER)
+    finally:
+        cluster.shutdown()
+
+def test_decimal_columns_keep_their_digits(tmp_path):
+    pa = pytest.importorskip('pyarrow')
+    import pyarrow.parquet
+    path = os.path.join(str(tmp_path), 'amounts.parquet')
+    amounts = [decimal.Decimal('12345678901234.07'), decimal.Decimal('0.01'), decimal.Decimal(2566.6666666666665)]
+    writer = export._Writer(pa, 'parquet', path, [('amount', 'decimal')])
+    writer.write([(amount,) for amount in amounts] + [(None,)])
+    writer.close()
+    exported = pa.parquet.read_table(path).column('amount').to_pylist()
+    assert exported[:2] == amounts[:2]
+    assert exported[2] == amounts[2].quantize(decimal.Decimal('1e-10'))
+    assert exported[3] is None
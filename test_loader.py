@@ -0,0 +1,44 @@
+#!/usr/bin/env python3
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+import config
+import loader
+import model
+
+@pytest.fixture
+def session():
+    cluster, session = config.connect(config.load_config(backend='memory'))
+    yield session
+    cluster.shutdown()
+
+def test_split_stream_fans_out_every_record():
+    streams = loader.split_stream(iter(range(2500)), [lambda n: [n], lambda n: [n] * (n % 2)], chunk_size=100)
+    # Consumers have to run concurrently: each queue holds two chunks at most
+    with ThreadPoolExecutor(max_workers=2) as pool:
+        every, odd = pool.map(list, streams)
+    assert every == list(range(2500))
+    assert odd == list(range(1, 2500, 2))
+
+def test_failing_table_stops_the_whole_load(session):
+    # One table's rows cannot be bound: the load must raise instead of leaving the
+    # producer and the other table's consumer waiting on the dead consumer
+    stmt = model.get_statements(session).get('insert_products_by_order')
+    good = lambda n: [(model.sequential_order_number(n), 'Producto', 1.0, 'Hogar', 1)]
+    bad = lambda n: [(model.sequential_order_number(n), 'Producto', 1.0, 'Hogar', 'bad-quantity')]
+    streams = loader.split_stream(iter(range(5000)), [good, bad], chunk_size=100)
+    outcome = []
+
+    def run():
+        try:
+            loader.BulkLoader(session).load_all([(stmt, streams[0], 'good'), (stmt, streams[1], 'bad')])
+        except Exception as exc:
+            outcome.append(exc)
+
+    thread = threading.Thread(target=run, daemon=True)
+    thread.start()
+    thread.join(timeout=30)
+    assert not thread.is_alive()
+    assert outcome and not isinstance(outcome[0], loader.StreamCancelled)
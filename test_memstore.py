@@ -0,0 +1,167 @@
+#!/usr/bin/env python3
+import asyncio
+import datetime
+import threading
+
+import pytest
+
+import aio
+import config
+import model
+import parallel_load
+import timeuuids
+
+# End-to-end checks on the in-memory backend (memstore.py): no cluster needed.
+# Run with: python -m pytest -q
+
+def connect(**overrides):
+    return config.connect(config.load_config(backend='memory', **overrides))
+
+@pytest.fixture(params=[False, True], ids=['flat', 'bucketed'])
+def session(request):
+    cluster, session = connect(bucketed=request.param)
+    yield session
+    cluster.shutdown()
+
+def clean(report):
+    return not (report['missing'] or report['stale'] or report['orphaned'] or report['divergent'])
+
+def order_numbers(session):
+    return [order[3] for email, *_ in model.CUSTOMERS
+            for order in model.query_rows(session, 'order_keys_by_customer', [email])]
+
+def load(session, orders_num, seed, processes=3):
+    # The ranges parallel_load.load hands its workers, loaded into this session
+    first_order = parallel_load.base_order(orders_num, seed)
+    for first, count in parallel_load.split_orders(orders_num, processes, first_order):
+        model.bulk_insert(session, count, seed=parallel_load.worker_seed(seed, first), first_order=first)
+
+def test_bulk_insert_leaves_summaries_consistent(session):
+    # Enough orders for shipments that share a timestamp and need the timeuuid tie-break
+    orders_num = 300 if model.get_statements(session).bucketed else 2000
+    model.bulk_insert(session, orders_num, seed=3, first_order=0)
+    report = model.check_order_summaries(session)
+    assert report['orders'] == orders_num
+    assert clean(report)
+
+def test_loads_with_different_seeds_do_not_collide(session):
+    load(session, 150, seed=1)
+    load(session, 150, seed=2)
+    assert len(set(order_numbers(session))) == 300
+    load(session, 150, seed=1)
+    assert len(order_numbers(session)) == 300
+    assert clean(model.check_order_summaries(session))
+
+def latest_shipment(session, order_number):
+    shipment = model.get_shipment(session, order_number, model.latest_shipment_date(session, order_number))
+    email = next(email for email, name, *_ in model.CUSTOMERS if name == shipment.customer_name)
+    return shipment, model.find_order_key(session, email, order_number)
+
+def test_status_update_keeps_shipment_tables_consistent(session):
+    model.bulk_insert(session, 20, seed=4, first_order=0)
+    order_number = model.sequential_order_number(7)
+    shipment, order_key = latest_shipment(session, order_number)
+    first, second = [status for status in model.SHIPMENT_STATUSES if status != shipment.ship_status][:2]
+
+    timestamp = model.write_time()
+    result = model.update_shipment_status(session, shipment, first, timestamp=timestamp, order_key=order_key)
+    # One delete in each table keyed by status, plus the summary
+    assert (result.requests, result.mutations, result.tombstones) == (5, 7, 2)
+    statuses = model.shipment_statuses(session, order_number)
+    assert not model.statuses_diverge(statuses)
+    assert statuses['shipments_by_o_ssd'][shipment.shipment_date] == {first}
+    assert clean(model.check_order_summaries(session, [order_key[0]]))
+
+def test_out_of_order_status_changes_converge(session):
+    model.bulk_insert(session, 20, seed=4, first_order=0)
+    order_number = model.sequential_order_number(7)
+    shipment, order_key = latest_shipment(session, order_number)
+    first, second = [status for status in model.SHIPMENT_STATUSES if status != shipment.ship_status][:2]
+    timestamp = model.write_time()
+    # X -> first, then first -> second, delivered the other way round
+    model.update_shipment_status(session, shipment._replace(ship_status=first), second, timestamp=timestamp + 1,
+                                 order_key=order_key)
+    model.update_shipment_status(session, shipment, first, timestamp=timestamp, order_key=order_key)
+    statuses = model.shipment_statuses(session, order_number)
+    assert not model.statuses_diverge(statuses)
+    assert statuses['shipments_by_o_tssd'][shipment.shipment_date] == {second}
+    assert clean(model.check_order_summaries(session, [order_key[0]]))
+
+def test_forked_status_changes_are_reported_divergent(session):
+    model.bulk_insert(session, 20, seed=4, first_order=0)
+    order_number = model.sequential_order_number(3)
+    shipment, order_key = latest_shipment(session, order_number)
+    first, second = [status for status in model.SHIPMENT_STATUSES if status != shipment.ship_status][:2]
+    timestamp = model.write_time()
+    model.update_shipment_status(session, shipment, first, timestamp=timestamp)
+    model.update_shipment_status(session, shipment, second, timestamp=timestamp + 1)
+    assert model.check_order_summaries(session, [order_key[0]])['divergent'] == [order_number]
+
+def test_recorded_shipment_updates_the_summary(session):
+    model.bulk_insert(session, 20, seed=4, first_order=0)
+    order_number = model.sequential_order_number(5)
+    shipment, order_key = latest_shipment(session, order_number)
+    later = timeuuids.from_timestamps([timeuuids.to_datetime(shipment.shipment_date) + datetime.timedelta(days=1)])[0]
+    new_shipment = shipment._replace(shipment_date=later, tracking_number='TRK-NEW', ship_status='Pending')
+    model.record_shipment(session, new_shipment, order_key=order_key)
+    model.record_shipment(session, new_shipment, order_key=order_key)
+    assert clean(model.check_order_summaries(session, [order_key[0]]))
+    summary = next(row for row in model.get_order_summaries(session, order_key[0]) if row.order_number == order_number)
+    assert (summary.shipment_count, summary.latest_ship_status) == (model.SHIPMENTS_PER_ORDER + 1, 'Pending')
+
+def test_order_details_respect_concurrency_limit():
+    cluster, session = connect(memory_latency=0.005)
+    try:
+        model.bulk_insert(session, 200, seed=1, first_order=0)
+        in_flight, peak = [0], [0]
+        lock = threading.Lock()
+        execute_async = session.execute_async
+
+        def done(_):
+            with lock:
+                in_flight[0] -= 1
+
+        def counted(*args, **kwargs):
+            future = execute_async(*args, **kwargs)
+            with lock:
+                in_flight[0] += 1
+                peak[0] = max(peak[0], in_flight[0])
+            future.add_callbacks(done, done)
+            return future
+
+        session.execute_async = counted
+        email = model.CUSTOMERS[0][0]
+        details = asyncio.run(aio.get_customer_order_details(session, email, limit=4))
+        assert len(details) == len(model.query_rows(session, 'order_keys_by_customer', [email]))
+        # Q2 and Q3.1 per order, at most limit orders at a time
+        assert 0 < peak[0] <= 2 * 4
+    finally:
+        cluster.shutdown()
+
+def read_pages(fetch):
+    rows, paging_state = [], None
+    while True:
+        page = fetch(paging_state)
+        assert len(page.rows) <= 10
+        rows.extend(page.rows)
+        if page.paging_state is None:
+            return rows
+        paging_state = page.paging_state
+
+def test_query_pages_resume_where_the_previous_one_ended(session):
+    # Shipments spread over two years: many month buckets in the bucketed layout
+    model.bulk_insert(session, 30, seed=2, first_order=0, shipments_per_order=25)
+    order_number = model.sequential_order_number(4)
+    rows = read_pages(lambda paging_state: model.find_shipments_page(session, order_number, page_size=10,
+                                                                     paging_state=paging_state))
+    assert rows == model.find_shipments(session, order_number)
+    assert len(rows) == 25
+
+    start_date, end_date = datetime.date(2024, 3, 1), datetime.date(2024, 10, 31)
+    rows = read_pages(lambda paging_state: model.find_shipments_page(
+        session, order_number, start_date=start_date, end_date=end_date, page_size=10, paging_state=paging_state))
+    assert rows == model.find_shipments(session, order_number, start_date=start_date, end_date=end_date)
+
+    email = model.CUSTOMERS[0][0]
+    rows = read_pages(lambda paging_state: model.get_orders_by_customer_page(session, email, 10, paging_state))
+    assert rows == model.get_orders_by_customer(session, email)
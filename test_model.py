@@ -0,0 +1,56 @@
+#!/usr/bin/env python3
+import datetime
+
+import pytest
+
+import model
+import timeuuids
+
+# Pure functions of model.py: no session needed
+
+def test_month_buckets_cover_the_range_newest_first():
+    assert model.month_buckets(datetime.date(2024, 11, 15), datetime.date(2025, 2, 1)) == [202502, 202501, 202412, 202411]
+    assert model.month_buckets(datetime.date(2024, 5, 31), datetime.date(2024, 5, 1)) == [202405]
+
+def test_select_buckets_keeps_listed_buckets_in_range():
+    listed = [202503, 202412, 202406, 202401]
+    assert model.select_buckets(listed) == listed
+    assert model.select_buckets(listed, start_date=datetime.date(2024, 6, 30)) == [202503, 202412, 202406]
+    assert model.select_buckets(listed, end_date=datetime.date(2024, 12, 1)) == [202412, 202406, 202401]
+    assert model.select_buckets(listed, datetime.date(2024, 7, 1), datetime.date(2024, 11, 30)) == []
+
+def test_month_bucket_of_a_timeuuid():
+    value = timeuuids.from_timestamps([datetime.datetime(2024, 12, 31, 23, 59)])[0]
+    assert model.month_bucket(value) == 202412
+
+def test_bucketed_statements_add_the_bucket_after_the_partition_key():
+    statement = model.STATEMENTS['shipments_by_o_ssd_date_range' + model.BUCKET_SUFFIX]
+    assert "FROM shipments_by_o_ssd_by_month\n" in statement
+    assert "WHERE order_number = ? AND bucket = ?" in statement
+    assert model.bucket_params('shipments_by_o_ssd', ['ORD-1', 'Pending', 'a', 'b'], 202401) == ['ORD-1', 202401, 'Pending', 'a', 'b']
+
+def test_planner_picks_the_table_that_serves_the_most_filters():
+    assert model.plan_shipments('ORD-1').table == 'shipments_by_o_sd'
+    assert model.plan_shipments('ORD-1', ship_status='Pending').table == 'shipments_by_o_ssd'
+    assert model.plan_shipments('ORD-1', ship_type='Express').table == 'shipments_by_o_tsd'
+    plan = model.plan_shipments('ORD-1', ship_status='Pending', ship_type='Express')
+    assert (plan.table, plan.residual) == ('shipments_by_o_tssd', {})
+    assert plan.params == ['ORD-1', 'Express', 'Pending']
+
+def test_planner_binds_date_bounds_and_picks_the_range_statement():
+    start_date, end_date = datetime.date(2024, 1, 1), datetime.date(2024, 1, 31)
+    plan = model.plan_shipments('ORD-1', ship_status='Pending', start_date=start_date)
+    assert plan.statement == 'shipments_by_o_ssd_from'
+    plan = model.plan_shipments('ORD-1', start_date=start_date, end_date=end_date)
+    assert plan.statement == 'shipments_by_o_sd_date_range'
+    assert plan.params[1:] == [timeuuids.min_timeuuid(start_date), timeuuids.max_timeuuid(end_date)]
+
+def test_forced_table_applies_the_other_filters_client_side():
+    plan = model.plan_shipments('ORD-1', ship_status='Pending', ship_type='Express', table='shipments_by_o_tsd')
+    assert (plan.table, plan.residual) == ('shipments_by_o_tsd', {'ship_status': 'Pending'})
+    shipments = [model.Shipment('ORD-1', None, 'TRK-1', status, 'Express', 1, 'Ana') for status in ('Pending', 'Delivered')]
+    assert [shipment.ship_status for shipment in model.apply_residual(plan, shipments)] == ['Pending']
+
+def test_forced_table_that_cannot_serve_the_filters_is_an_error():
+    with pytest.raises(ValueError):
+        model.plan_shipments('ORD-1', table='shipments_by_o_tssd', ship_type='Express')
@@ -0,0 +1,42 @@
+#!/usr/bin/env python3
+import datetime
+import random
+import uuid
+
+import timeuuids
+
+def cassandra_key(value):
+    # TimeUUIDType's comparison as Cassandra defines it: the timestamp, then the
+    # clock sequence and node bytes one by one as signed bytes
+    return value.time, tuple(byte - 256 if byte > 127 else byte for byte in value.bytes[8:])
+
+def test_generated_uuids_are_version_1_with_their_timestamp():
+    moment = datetime.datetime(2024, 8, 27, 13, 45, 12, 345678)
+    value = timeuuids.from_timestamp(moment, random.Random(1))
+    assert (value.version, value.variant) == (1, uuid.RFC_4122)
+    assert timeuuids.to_datetime(value) == moment
+
+def test_sort_key_matches_cassandra_order():
+    rng = random.Random(7)
+    moments = [datetime.datetime(2024, 1, 1) + datetime.timedelta(microseconds=rng.randrange(5)) for _ in range(500)]
+    values = timeuuids.from_timestamps(moments, rng)
+    # Same timestamps with every sign of clock sequence and node byte
+    values += [uuid.UUID(int=values[0].int & ~0xffffffffffffffff | rng.getrandbits(64)) for _ in range(500)]
+    assert sorted(values, key=timeuuids.sort_key) == sorted(values, key=cassandra_key)
+
+def test_min_and_max_timeuuid_bound_their_millisecond():
+    moment = datetime.datetime(2025, 3, 9, 8, 30, 0, 250000)
+    rng = random.Random(3)
+    inside = timeuuids.from_timestamps([moment + datetime.timedelta(microseconds=n) for n in range(1000)], rng)
+    lowest, highest = timeuuids.min_timeuuid(moment), timeuuids.max_timeuuid(moment)
+    assert all(cassandra_key(lowest) <= cassandra_key(value) <= cassandra_key(highest) for value in inside)
+    before = timeuuids.from_timestamp(moment - datetime.timedelta(microseconds=1), rng)
+    after = timeuuids.from_timestamp(moment + datetime.timedelta(milliseconds=1), rng)
+    assert cassandra_key(before) < cassandra_key(lowest)
+    assert cassandra_key(highest) < cassandra_key(after)
+
+def test_min_timeuuid_sorts_before_every_uuid_of_its_timestamp():
+    moment = datetime.date(2024, 6, 1)
+    lowest = timeuuids.min_timeuuid(moment)
+    same_time = [uuid.UUID(int=lowest.int & ~0xffffffffffffffff | bits) for bits in (0, 0x7f << 56, 0xff << 56, 2 ** 64 - 1)]
+    assert all(timeuuids.sort_key(lowest) <= timeuuids.sort_key(value) for value in same_time)
@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+import datetime
+import json
+import random
+import sys
+import time
+import uuid
+
+# Version 1 (time-based) UUIDs built with integer arithmetic, a batch at a time.
+# Timestamps are datetimes (naive means UTC), dates (midnight UTC) or POSIX seconds.
+
+# 100 ns intervals between 1582-10-15 (UUID epoch) and 1970-01-01
+GREGORIAN_OFFSET = 0x01b21dd213814000
+# Clock sequence and node bytes Cassandra uses for minTimeuuid/maxTimeuuid; it
+# compares them as signed bytes, so 0x80... sorts first and 0x7f... last.
+MIN_CLOCK_SEQ_AND_NODE = 0x8080808080808080
+MAX_CLOCK_SEQ_AND_NODE = 0x7f7f7f7f7f7f7f7f
+# maxTimeuuid covers the whole millisecond of its timestamp
+TICKS_PER_MILLISECOND = 10000
+VARIANT = 0x8000000000000000
+
+EPOCH = datetime.datetime(1970, 1, 1)
+EPOCH_DATE = EPOCH.date()
+MICROSECOND = datetime.timedelta(microseconds=1)
+MICROS_PER_DAY = 86400 * 1000000
+
+def to_micros(value):
+    if isinstance(value, datetime.datetime):
+        if value.tzinfo is not None:
+            value = value.astimezone(datetime.timezone.utc).replace(tzinfo=None)
+        return (value - EPOCH) // MICROSECOND
+    if isinstance(value, datetime.date):
+        return (value - EPOCH_DATE).days * MICROS_PER_DAY
+    return int(round(value * 1000000))
+
+def _msb(ticks):
+    return ((ticks & 0xffffffff) << 32) | (((ticks >> 32) & 0xffff) << 16) | 0x1000 | ((ticks >> 48) & 0x0fff)
+
+def _uuid(value, _new=object.__new__, _setattr=object.__setattr__, _safe=uuid.SafeUUID.unknown):
+    # uuid.UUID(int=value) without the argument parsing and range checks
+    result = _new(uuid.UUID)
+    _setattr(result, 'int', value)
+    _setattr(result, 'is_safe', _safe)
+    return result
+
+def from_timestamps(timestamps, rng=random):
+    # One TimeUUID per timestamp, with random clock sequence and node bits from rng
+    getrandbits = rng.getrandbits
+    return [
+        _uuid(_msb(to_micros(timestamp) * 10 + GREGORIAN_OFFSET) << 64 | VARIANT | getrandbits(62))
+        for timestamp in timestamps
+    ]
+
+def from_timestamp(timestamp, rng=random):
+    return from_timestamps([timestamp], rng)[0]
+
+# Client-side equivalents of CQL minTimeuuid(ts) / maxTimeuuid(ts), so range
+# queries can bind plain timeuuid values
+def min_timeuuid(timestamp):
+    ms_ticks = to_micros(timestamp) // 1000 * TICKS_PER_MILLISECOND
+    return uuid.UUID(int=_msb(ms_ticks + GREGORIAN_OFFSET) << 64 | MIN_CLOCK_SEQ_AND_NODE)
+
+def max_timeuuid(timestamp):
+    ms_ticks = to_micros(timestamp) // 1000 * TICKS_PER_MILLISECOND + TICKS_PER_MILLISECOND - 1
+    return uuid.UUID(int=_msb(ms_ticks + GREGORIAN_OFFSET) << 64 | MAX_CLOCK_SEQ_AND_NODE)
+
+def sort_key(value):
+    # Cassandra's timeuuid order: timestamp, then the clock sequence and node bytes
+    # compared as signed bytes (flipping each sign bit makes that an unsigned comparison)
+    return value.time, (value.int & 0xffffffffffffffff) ^ 0x8080808080808080
+
+def to_datetime(value):
+    ticks = ((value.int >> 64 & 0x0fff) << 48 | (value.int >> 80 & 0xffff) << 32 | value.int >> 96) - GREGORIAN_OFFSET
+    return datetime.datetime(1970, 1, 1) + datetime.timedelta(microseconds=ticks // 10)
+
+# Micro-benchmark against the time_uuid path model.random_date used before:
+#   python3 timeuuids.py [count]
+def benchmark(count=100000, seed=42):
+    import time_uuid
+
+    rng = random.Random(seed)
+    start = datetime.datetime(2024, 1, 1)
+    dates = [start + datetime.timedelta(days=rng.randrange(730)) for _ in range(count)]
+
+    started = time.perf_counter()
+    for date in dates:
+        time_uuid.TimeUUID.with_timestamp(time_uuid.mkutime(date))
+    baseline = time.perf_counter() - started
+
+    started = time.perf_counter()
+    from_timestamps(dates, rng)
+    batched = time.perf_counter() - started
+
+    return {
+        'count': count,
+        'time_uuid_seconds': round(baseline, 4),
+        'timeuuids_seconds': round(batched, 4),
+        'time_uuid_per_sec': round(count / baseline),
+        'timeuuids_per_sec': round(count / batched),
+        'speedup': round(baseline / batched, 2),
+    }
+
+if __name__ == '__main__':
+    print(json.dumps(benchmark(int(sys.argv[1]) if len(sys.argv) > 1 else 100000)))